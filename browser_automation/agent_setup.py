@@ -8,24 +8,44 @@ from langchain.tools.base import BaseTool
 
 from env_setup import setup_environment
 from langchain_setup import create_playwright_toolkit
+from checkpoint import CheckpointStore
+from plan_agent import PlanAndExecuteAgent
+from scratchpad import RecallObservationTool, ScratchpadManager
+from playwright_utils import create_custom_sync_playwright_browser
 
-def create_browser_agent(tools: List[BaseTool], verbose: bool = True):
+def create_llm() -> ChatOpenAI:
+    """Create the chat model shared by the agents."""
+    return ChatOpenAI(
+        temperature=0,
+        model="gpt-3.5-turbo-0125",
+    )
+
+def create_browser_agent(
+    tools: List[BaseTool],
+    verbose: bool = True,
+    scratchpad: Optional[ScratchpadManager] = None,
+):
     """Create a browser-operable agent using OpenAI GPT.
     
     Args:
         tools: List of tools to provide to the agent.
         verbose: Whether to print agent actions. Default is True.
+        scratchpad: Optional scratchpad manager that compacts older observations to a token ceiling.
         
     Returns:
-        An initialized agent that can use the provided tools.
+        An initialized agent that can use the provided tools. Callback handlers, e.g. for
+        prefetching, must be passed per call with agent.invoke(..., config={"callbacks": [...]})
+        so that they also receive the tool runs.
     """
     if not setup_environment():
         raise ValueError("Environment setup failed. Please check your .env file.")
     
-    llm = ChatOpenAI(
-        temperature=0,
-        model="gpt-3.5-turbo-0125",
-    )
+    llm = create_llm()
+    
+    extra_kwargs = {}
+    if scratchpad is not None:
+        tools = list(tools) + [RecallObservationTool(scratchpad)]
+        extra_kwargs["trim_intermediate_steps"] = scratchpad
     
     agent = initialize_agent(
         tools=tools,
@@ -33,11 +53,47 @@ def create_browser_agent(tools: List[BaseTool], verbose: bool = True):
         agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
         verbose=verbose,
         handle_parsing_errors=True,
+        **extra_kwargs,
     )
     
     print("Browser-operable agent created successfully!")
     return agent
 
+def create_plan_execute_agent(
+    sync_browser=None,
+    verbose: bool = True,
+    max_replans: int = 2,
+    checkpoint_store: Optional[CheckpointStore] = None,
+    run_id: Optional[str] = None,
+):
+    """Create an agent that plans a whole BrowserFlow in one LLM call and executes it.
+    
+    Args:
+        sync_browser: Optional synchronous browser instance to execute the flow in.
+        verbose: Whether to print the plan and execution progress. Default is True.
+        max_replans: Maximum number of re-plans after a failing step. Default is 2.
+        checkpoint_store: Optional store to save and resume checkpoints with.
+        run_id: Identifier of the run, required when checkpoint_store is given.
+        
+    Returns:
+        A PlanAndExecuteAgent with the same invoke interface as the ReAct agent.
+    """
+    if not setup_environment():
+        raise ValueError("Environment setup failed. Please check your .env file.")
+    
+    browser = sync_browser or create_custom_sync_playwright_browser()
+    agent = PlanAndExecuteAgent(
+        llm=create_llm(),
+        sync_browser=browser,
+        verbose=verbose,
+        max_replans=max_replans,
+        checkpoint_store=checkpoint_store,
+        run_id=run_id,
+    )
+    
+    print("Plan-and-execute agent created successfully!")
+    return agent
+
 def test_agent():
     """Test the browser-operable agent with a simple task."""
     tools = create_playwright_toolkit()
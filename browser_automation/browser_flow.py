@@ -5,12 +5,30 @@ This module defines the browser operation flow for the automated browser operati
 It breaks down manual browser operations into detailed, step-by-step instructions.
 """
 
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 import json
+import re
+
+from domain_scheduler import scheduled_action, scheduled_goto
+
+class FlowExecutionError(Exception):
+    """Raised when an operation in a flow fails during execution."""
+    
+    def __init__(self, index: int, operation: "BrowserOperation", error: Exception, results: List[str]):
+        super().__init__(f"Operation {index} ({operation.description}) failed: {str(error)}")
+        self.index = index
+        self.operation = operation
+        self.error = error
+        self.results = results
 
 class BrowserOperation:
     """Base class for browser operations."""
     
+    # from_dictで必須となるフィールド
+    required_fields: List[str] = []
+    # from_dictで省略可能なフィールドとその型
+    optional_fields: Dict[str, type] = {}
+    
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
@@ -22,10 +40,36 @@ class BrowserOperation:
             "description": self.description,
             "type": self.__class__.__name__
         }
+    
+    def execute(self, page: Any, results: List[str]) -> Optional[str]:
+        """Execute the operation on a Playwright page.
+        
+        Args:
+            page: The synchronous Playwright page to operate on.
+            results: Content extracted by earlier operations in the flow.
+            
+        Returns:
+            Extracted content, or None if the operation does not produce any.
+        """
+        raise NotImplementedError
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BrowserOperation":
+        """Create an operation from a dictionary produced by to_dict."""
+        errors = validate_operation_dict(data)
+        if errors:
+            raise ValueError("; ".join(errors))
+        return OPERATION_TYPES[data["type"]]._from_fields(data)
+    
+    @classmethod
+    def _from_fields(cls, data: Dict[str, Any]) -> "BrowserOperation":
+        raise NotImplementedError
 
 class NavigateOperation(BrowserOperation):
     """Operation to navigate to a URL."""
     
+    required_fields = ["url"]
+    
     def __init__(self, url: str):
         super().__init__(
             name="Navigate",
@@ -37,27 +81,63 @@ class NavigateOperation(BrowserOperation):
         result = super().to_dict()
         result["url"] = self.url
         return result
+    
+    def execute(self, page: Any, results: List[str]) -> Optional[str]:
+        scheduled_goto(page, self.url)
+        return None
+    
+    @classmethod
+    def _from_fields(cls, data: Dict[str, Any]) -> "NavigateOperation":
+        return cls(url=data["url"])
 
 class SearchOperation(BrowserOperation):
     """Operation to enter a search keyword into a form."""
     
-    def __init__(self, selector: str, keyword: str):
+    required_fields = ["selector", "keyword"]
+    optional_fields = {"submit": bool}
+    
+    def __init__(self, selector: str, keyword: str, submit: bool = False):
+        desc = f"Enter '{keyword}' into {selector}"
+        if submit:
+            desc += " and press Enter"
+        
         super().__init__(
             name="Search",
-            description=f"Enter '{keyword}' into {selector}"
+            description=desc
         )
         self.selector = selector
         self.keyword = keyword
+        self.submit = submit
     
     def to_dict(self) -> Dict[str, Any]:
         result = super().to_dict()
         result["selector"] = self.selector
         result["keyword"] = self.keyword
+        if self.submit:
+            result["submit"] = self.submit
         return result
+    
+    def execute(self, page: Any, results: List[str]) -> Optional[str]:
+        page.fill(self.selector, self.keyword)
+        if self.submit:
+            scheduled_action(page, lambda: page.press(self.selector, "Enter"))
+            page.wait_for_load_state()
+        return None
+    
+    @classmethod
+    def _from_fields(cls, data: Dict[str, Any]) -> "SearchOperation":
+        return cls(
+            selector=data["selector"],
+            keyword=data["keyword"],
+            submit=bool(data.get("submit", False))
+        )
 
 class ClickOperation(BrowserOperation):
     """Operation to click on an element."""
     
+    required_fields = ["selector"]
+    optional_fields = {"description": str}
+    
     def __init__(self, selector: str, description: Optional[str] = None):
         desc = description or f"Click on element matching '{selector}'"
         super().__init__(
@@ -70,10 +150,21 @@ class ClickOperation(BrowserOperation):
         result = super().to_dict()
         result["selector"] = self.selector
         return result
+    
+    def execute(self, page: Any, results: List[str]) -> Optional[str]:
+        scheduled_action(page, lambda: page.click(self.selector))
+        page.wait_for_load_state()
+        return None
+    
+    @classmethod
+    def _from_fields(cls, data: Dict[str, Any]) -> "ClickOperation":
+        return cls(selector=data["selector"], description=data.get("description"))
 
 class ExtractOperation(BrowserOperation):
     """Operation to extract content from the page."""
     
+    optional_fields = {"selector": str}
+    
     def __init__(self, selector: Optional[str] = None):
         desc = "Extract content from the entire page"
         if selector:
@@ -90,10 +181,33 @@ class ExtractOperation(BrowserOperation):
         if self.selector:
             result["selector"] = self.selector
         return result
+    
+    def execute(self, page: Any, results: List[str]) -> Optional[str]:
+        if self.selector:
+            return "\n".join(page.locator(self.selector).all_inner_texts())
+        return page.inner_text("body")
+    
+    @classmethod
+    def _from_fields(cls, data: Dict[str, Any]) -> "ExtractOperation":
+        return cls(selector=data.get("selector"))
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# 条件文に含まれてもほぼすべての行に一致してしまう語
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "that", "this", "are", "was", "all", "any",
+    "about", "into", "only", "than", "then", "them", "they", "their", "there", "which",
+    "what", "where", "when", "who", "how", "show", "find", "list", "get", "give", "items",
+}
+
+def _words(text: str) -> set:
+    return set(WORD_PATTERN.findall(text.lower()))
 
 class FilterOperation(BrowserOperation):
     """Operation to filter extracted information."""
     
+    required_fields = ["criteria"]
+    
     def __init__(self, criteria: str):
         super().__init__(
             name="Filter",
@@ -105,6 +219,58 @@ class FilterOperation(BrowserOperation):
         result = super().to_dict()
         result["criteria"] = self.criteria
         return result
+    
+    def execute(self, page: Any, results: List[str]) -> Optional[str]:
+        """Keep the lines of the latest extracted content that contain any criteria keyword.
+
+        Keywords are words of at least three characters that are not stopwords, and match
+        words in a line that start with them, e.g. "laptop" matches "laptops".
+        If the criteria have no keywords, the content is returned unchanged.
+        """
+        if not results:
+            return None
+        terms = {word for word in _words(self.criteria) if len(word) > 2 and word not in STOPWORDS}
+        if not terms:
+            return results[-1]
+        lines = [
+            line for line in results[-1].splitlines()
+            if any(word.startswith(term) for word in _words(line) for term in terms)
+        ]
+        return "\n".join(lines)
+    
+    @classmethod
+    def _from_fields(cls, data: Dict[str, Any]) -> "FilterOperation":
+        return cls(criteria=data["criteria"])
+
+OPERATION_TYPES = {
+    op_type.__name__: op_type
+    for op_type in [NavigateOperation, SearchOperation, ClickOperation, ExtractOperation, FilterOperation]
+}
+
+def validate_operation_dict(data: Any) -> List[str]:
+    """Check a dictionary against the available operation types.
+    
+    Returns:
+        A list of problems found. An empty list means the dictionary is valid.
+    """
+    if not isinstance(data, dict):
+        return [f"Operation must be an object, got {type(data).__name__}"]
+    
+    op_type = OPERATION_TYPES.get(data["type"]) if isinstance(data.get("type"), str) else None
+    if op_type is None:
+        return [f"Unknown operation type '{data.get('type')}'. Available types: {', '.join(OPERATION_TYPES)}"]
+    
+    errors = [
+        f"{data['type']} is missing required field '{field}'"
+        for field in op_type.required_fields
+        if not isinstance(data.get(field), str) or not data.get(field)
+    ]
+    errors.extend(
+        f"{data['type']} field '{field}' must be of type {field_type.__name__}"
+        for field, field_type in op_type.optional_fields.items()
+        if data.get(field) is not None and not isinstance(data[field], field_type)
+    )
+    return errors
 
 class BrowserFlow:
     """A sequence of browser operations forming a complete flow."""
@@ -129,6 +295,71 @@ class BrowserFlow:
     def to_json(self, indent: int = 2) -> str:
         """Convert the flow to a JSON string."""
         return json.dumps(self.to_dict(), indent=indent)
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BrowserFlow":
+        """Create a flow from a dictionary produced by to_dict.
+        
+        Raises:
+            ValueError: If the dictionary is not a valid flow.
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"Flow must be an object, got {type(data).__name__}")
+        if not isinstance(data.get("operations", []), list):
+            raise ValueError("'operations' must be a list")
+        for field in ("name", "description"):
+            if data.get(field) is not None and not isinstance(data[field], str):
+                raise ValueError(f"'{field}' must be a string")
+        flow = cls(
+            name=data.get("name", "Untitled Flow"),
+            description=data.get("description", "")
+        )
+        for index, op_data in enumerate(data.get("operations", [])):
+            try:
+                flow.add_operation(BrowserOperation.from_dict(op_data))
+            except ValueError as e:
+                raise ValueError(f"Operation {index}: {str(e)}")
+        return flow
+    
+    @classmethod
+    def from_json(cls, text: str) -> "BrowserFlow":
+        """Create a flow from a JSON string."""
+        return cls.from_dict(json.loads(text))
+    
+    def run(
+        self,
+        page: Any,
+        start: int = 0,
+        results: Optional[List[str]] = None,
+        on_step: Optional[Callable[[int, List[str]], None]] = None,
+    ) -> List[str]:
+        """Execute the flow's operations in order on a Playwright page.
+        
+        Args:
+            page: The synchronous Playwright page to operate on.
+            start: Index of the first operation to execute.
+            results: Content extracted by operations before start, if resuming.
+            on_step: Optional callback called with the operation index and the results so far
+                after each completed operation, e.g. to save a checkpoint.
+            
+        Returns:
+            The content extracted by the flow.
+            
+        Raises:
+            FlowExecutionError: If an operation fails.
+        """
+        results = list(results or [])
+        for index in range(start, len(self.operations)):
+            operation = self.operations[index]
+            try:
+                output = operation.execute(page, results)
+            except Exception as e:
+                raise FlowExecutionError(index, operation, e, results) from e
+            if output is not None:
+                results.append(output)
+            if on_step:
+                on_step(index, list(results))
+        return results
 
 def create_example_flow() -> BrowserFlow:
     """Create an example browser operation flow."""
@@ -183,7 +414,32 @@ def create_google_search_flow(keyword: str) -> BrowserFlow:
     
     return flow
 
+def test_validate_operation_dict():
+    """Test operation validation with malformed operations."""
+    cases = [
+        {"type": "NavigateOperation", "url": "https://example.com"},
+        {"type": ["NavigateOperation"]},
+        {"type": {"name": "NavigateOperation"}},
+        {"type": "ExtractOperation", "selector": 3},
+        {"type": "SearchOperation", "selector": "input", "keyword": "x", "submit": "yes"},
+        "NavigateOperation",
+    ]
+    for case in cases:
+        print(f"{case!r}: {validate_operation_dict(case) or 'valid'}")
+    
+    for data in [{"operations": [{"type": ["x"]}]}, {"operations": None}]:
+        try:
+            BrowserFlow.from_dict(data)
+            print(f"{data!r}: accepted")
+        except ValueError as e:
+            print(f"{data!r}: rejected ({str(e)})")
+    
+    print("\nValidation test completed!")
+
 if __name__ == "__main__":
+    test_validate_operation_dict()
+    print()
+    
     example_flow = create_example_flow()
     print("Example Flow:")
     print(example_flow.to_json())
@@ -1,32 +1,37 @@
 import asyncio
 from playwright.async_api import async_playwright
 
-async def initialize_browser(headless=True):
+from browser_launcher import DEFAULT_USER_DATA_DIR, get_profile
+
+async def initialize_browser(headless=None, profile=None, user_data_dir=DEFAULT_USER_DATA_DIR):
     """Initialize a Playwright browser.
     
     Args:
-        headless (bool): Whether to run browser in headless mode. Default is True.
+        headless (bool): Whether to run browser in headless mode. Default is taken from the profile.
+        profile (str): Name of the launch profile in browser_launcher. Default is BROWSER_PROFILE or "fast-headless".
+        user_data_dir (str): Optional directory for a persistent profile whose caches survive restarts.
+    
+    Returns:
+        A tuple of (playwright, browser, context, page). With a user data directory, the
+        persistent context is returned in place of the browser, since it owns the browser process.
     """
-    print(f"Initializing Playwright browser (headless={headless})...")
+    launch_profile = get_profile(profile)
+    browser_options = launch_profile.launch_options(headless=headless)
+    print(f"Initializing Playwright browser (profile={launch_profile.name}, headless={browser_options['headless']})...")
     playwright = await async_playwright().start()
     
-    # 追加のオプションを設定
-    browser_options = {
-        "headless": headless,
-        "args": [
-            "--disable-gpu",
-            "--disable-dev-shm-usage",
-            "--disable-setuid-sandbox",
-            "--no-first-run",
-            "--no-sandbox",
-            "--no-zygote",
-            "--single-process"
-        ]
-    }
-    
-    browser = await playwright.chromium.launch(**browser_options)
-    context = await browser.new_context()
-    page = await context.new_page()
+    if user_data_dir:
+        context = await playwright.chromium.launch_persistent_context(
+            user_data_dir,
+            **browser_options,
+            **launch_profile.context_options
+        )
+        browser = context
+        page = context.pages[0] if context.pages else await context.new_page()
+    else:
+        browser = await playwright.chromium.launch(**browser_options)
+        context = await browser.new_context(**launch_profile.context_options)
+        page = await context.new_page()
     
     print("Browser initialized successfully!")
     return playwright, browser, context, page
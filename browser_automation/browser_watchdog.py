@@ -0,0 +1,187 @@
+"""
+Browser Memory Watchdog
+
+This module tracks the memory usage and page count of a long-lived browser and recycles
+its context or the whole browser once configured limits are reached. Recycling only
+happens when the owner calls recycle_if_needed between jobs, never in the middle of a step.
+"""
+
+import time
+from typing import Any, Callable, Dict, Optional
+
+from playwright_utils import (
+    close_sync_browser,
+    create_custom_sync_playwright_browser,
+    process_tree_rss,
+    reset_browser_context,
+)
+
+class BrowserWatchdog:
+    """Watch one synchronous browser and recycle it when it grows too large or too old."""
+
+    def __init__(
+        self,
+        max_context_pages: Optional[int] = 50,
+        max_browser_pages: Optional[int] = 500,
+        max_browser_age_minutes: Optional[float] = 60.0,
+        max_rss_mb: Optional[float] = 1024.0,
+        launch: Optional[Callable[[], Any]] = None,
+    ):
+        """Initialize the watchdog.
+
+        Args:
+            max_context_pages: Recycle the context after this many page loads in it. Contexts that
+                are reset between jobs, as in the job server, rarely reach this limit.
+            max_browser_pages: Restart the browser after this many page loads since it was launched,
+                across all of its contexts.
+            max_browser_age_minutes: Restart the browser after it has run this long.
+            max_rss_mb: Restart the browser once its process tree uses more memory than this.
+            launch: Function that launches a replacement browser. Defaults to relaunching with the
+                watched browser's launch options.
+        """
+        self.max_context_pages = max_context_pages
+        self.max_browser_pages = max_browser_pages
+        self.max_browser_age_minutes = max_browser_age_minutes
+        self.max_rss_mb = max_rss_mb
+        self.launch = launch
+        self.browser: Any = None
+        self.browser_started_at = 0.0
+        self.context_started_at = 0.0
+        self.context_pages = 0
+        self.browser_pages = 0
+        self.total_pages = 0
+        self.recycles: Dict[str, int] = {}
+        self._tracked_context: Any = None
+
+    def watch(self, browser: Any) -> Any:
+        """Start watching a newly launched browser.
+
+        The watchdog registers itself in the browser's context_hooks, so contexts that
+        replace the current one, e.g. when a checkpoint is restored, are tracked as well.
+
+        Returns:
+            The same browser.
+        """
+        self.browser = browser
+        self.browser_started_at = time.time()
+        self.browser_pages = 0
+        if self.track_context not in browser.context_hooks:
+            browser.context_hooks.append(self.track_context)
+        self.track_context()
+        return browser
+
+    def track_context(self, context: Any = None) -> None:
+        """Start counting page loads in a context from zero.
+
+        Args:
+            context: The context to track. Defaults to the browser's current context.
+        """
+        self.context_started_at = time.time()
+        self.context_pages = 0
+
+        if context is None:
+            context = self.browser.context
+        if context is self._tracked_context:
+            # 永続コンテキストは初期化後も同じオブジェクトのため、リスナーは登録済み
+            return
+        self._tracked_context = context
+
+        def on_frame_navigated(frame: Any) -> None:
+            if frame.parent_frame is None:
+                self.context_pages += 1
+                self.browser_pages += 1
+                self.total_pages += 1
+
+        for page in context.pages:
+            page.on("framenavigated", on_frame_navigated)
+        context.on("page", lambda page: page.on("framenavigated", on_frame_navigated))
+
+    def rss_mb(self) -> Optional[float]:
+        """Return the memory used by the browser's process tree in megabytes, if available."""
+        pid = getattr(self.browser, "driver_pid", None)
+        if pid is None:
+            return None
+        rss = process_tree_rss(pid)
+        return rss / (1024 * 1024) if rss is not None else None
+
+    def recycle_reason(self) -> Optional[str]:
+        """Return why the browser or context should be recycled, or None if it is healthy."""
+        if not self.browser.is_connected():
+            return "disconnected"
+
+        rss = self.rss_mb()
+        if self.max_rss_mb is not None and rss is not None and rss > self.max_rss_mb:
+            return "rss"
+
+        age_minutes = (time.time() - self.browser_started_at) / 60
+        if self.max_browser_age_minutes is not None and age_minutes > self.max_browser_age_minutes:
+            return "age"
+
+        if self.max_browser_pages is not None and self.browser_pages >= self.max_browser_pages:
+            return "browser_pages"
+
+        if self.max_context_pages is not None and self.context_pages >= self.max_context_pages:
+            return "pages"
+
+        return None
+
+    def recycle_if_needed(self) -> Any:
+        """Recycle the context or restart the browser if a limit has been reached.
+
+        Only call this between jobs. Tools holding the old browser must be recreated
+        when a new browser is returned.
+
+        Returns:
+            The browser to use from now on, which may be a new instance.
+        """
+        reason = self.recycle_reason()
+        if reason is None:
+            return self.browser
+
+        self.recycles[reason] = self.recycles.get(reason, 0) + 1
+
+        if reason == "pages":
+            print(f"Recycling browser context after {self.context_pages} pages")
+            reset_browser_context(self.browser)
+            return self.browser
+
+        print(f"Restarting browser ({reason})")
+        try:
+            close_sync_browser(self.browser)
+        except Exception as e:
+            print(f"Error closing browser: {str(e)}")
+        if self.launch is not None:
+            return self.watch(self.launch())
+        return self.watch(create_custom_sync_playwright_browser(**self.browser.launch_options))
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return the watchdog's current measurements and recycle counts."""
+        rss = self.rss_mb()
+        now = time.time()
+        return {
+            "rss_mb": round(rss, 1) if rss is not None else None,
+            "context_pages": self.context_pages,
+            "browser_pages": self.browser_pages,
+            "total_pages": self.total_pages,
+            "open_pages": len(self.browser.context.pages) if self.browser else 0,
+            "browser_age_seconds": round(now - self.browser_started_at) if self.browser else 0,
+            "context_age_seconds": round(now - self.context_started_at) if self.browser else 0,
+            "recycles": dict(self.recycles),
+        }
+
+def test_watchdog():
+    """Test the watchdog by loading a few pages with a low page limit."""
+    watchdog = BrowserWatchdog(max_context_pages=2)
+    browser = watchdog.watch(create_custom_sync_playwright_browser())
+    try:
+        for _ in range(3):
+            browser.page.goto("https://example.com")
+            print("Metrics:", watchdog.metrics())
+            browser = watchdog.recycle_if_needed()
+    finally:
+        close_sync_browser(browser)
+
+    print("\nWatchdog test completed!")
+
+if __name__ == "__main__":
+    test_watchdog()
@@ -0,0 +1,215 @@
+"""
+Checkpointing and Resume
+
+This module saves the progress of flow and agent runs after every completed step, so that
+a failed run can be resumed from its last good step in a fresh browser context instead of
+starting again from the first navigation.
+
+A checkpoint records the index of the next operation (or the completed agent steps), the
+content extracted so far, the current URL and the context's storage state.
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from browser_flow import BrowserFlow
+from domain_scheduler import scheduled_goto
+from playwright_utils import replace_browser_context
+
+class CheckpointStore:
+    """Store checkpoints as JSON files in a directory, one file per run."""
+
+    def __init__(self, directory: str = "checkpoints"):
+        """Initialize the store and create its directory if needed.
+
+        Args:
+            directory: Directory the checkpoint files are written to.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, run_id: str) -> str:
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in run_id)
+        return os.path.join(self.directory, f"{safe_id}.json")
+
+    def save(self, run_id: str, checkpoint: Dict[str, Any]) -> None:
+        """Save a checkpoint, replacing the previous one for the run."""
+        checkpoint = {**checkpoint, "run_id": run_id, "updated_at": time.time()}
+        path = self._path(run_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        # 書き込み途中で落ちても前回のチェックポイントが壊れないよう、置き換えで保存する
+        os.replace(tmp_path, path)
+
+    def load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Return the last checkpoint for the run, or None if there is none."""
+        try:
+            with open(self._path(run_id), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def delete(self, run_id: str) -> None:
+        """Delete the checkpoint for the run, if any."""
+        try:
+            os.remove(self._path(run_id))
+        except FileNotFoundError:
+            pass
+
+def capture_browser_state(browser: Any) -> Dict[str, Any]:
+    """Return the current URL and storage state of the browser's context."""
+    return {
+        "url": browser.page.url,
+        "storage_state": browser.context.storage_state(),
+    }
+
+def restore_browser_state(browser: Any, checkpoint: Dict[str, Any]) -> Any:
+    """Open a fresh context with the checkpoint's storage state and go back to its URL.
+
+    Returns:
+        The new page.
+    """
+    replace_browser_context(browser, storage_state=checkpoint.get("storage_state"))
+    url = checkpoint.get("url")
+    if url and url != "about:blank":
+        scheduled_goto(browser.page, url)
+    return browser.page
+
+def run_flow_with_checkpoints(
+    flow: BrowserFlow,
+    browser: Any,
+    store: CheckpointStore,
+    run_id: str,
+    resume: bool = True,
+) -> List[str]:
+    """Run a flow, saving a checkpoint after each completed operation.
+
+    If a checkpoint exists for the run and resume is True, the flow continues from the
+    operation after the last completed one. The checkpoint is deleted once the flow succeeds.
+
+    Args:
+        flow: The flow to run.
+        browser: Synchronous browser to run the flow in.
+        store: Store the checkpoints are saved to.
+        run_id: Identifier of the run.
+        resume: Whether to resume from an existing checkpoint.
+
+    Returns:
+        The content extracted by the flow.
+
+    Raises:
+        FlowExecutionError: If an operation fails. The last checkpoint is kept.
+    """
+    checkpoint = store.load(run_id) if resume else None
+    start = 0
+    results: List[str] = []
+
+    if checkpoint and checkpoint.get("kind") == "flow":
+        start = checkpoint["next_index"]
+        results = checkpoint["results"]
+        restore_browser_state(browser, checkpoint)
+        print(f"Resuming run {run_id} from operation {start}")
+
+    def save_checkpoint(index: int, step_results: List[str]) -> None:
+        store.save(run_id, {
+            "kind": "flow",
+            "flow": flow.to_dict(),
+            "next_index": index + 1,
+            "results": step_results,
+            **capture_browser_state(browser),
+        })
+
+    results = flow.run(browser.page, start=start, results=results, on_step=save_checkpoint)
+    store.delete(run_id)
+    return results
+
+class AgentCheckpointHandler(BaseCallbackHandler):
+    """Callback handler that saves a checkpoint after each completed agent step."""
+
+    def __init__(self, browser: Any, store: CheckpointStore, run_id: str, instruction: str):
+        self.browser = browser
+        self.store = store
+        self.run_id = run_id
+        self.instruction = instruction
+        previous = store.load(run_id)
+        self.steps: List[Dict[str, Any]] = previous["steps"] if previous and previous.get("kind") == "agent" else []
+        self._pending: Optional[Dict[str, Any]] = None
+
+    def on_agent_action(self, action: Any, **kwargs: Any) -> None:
+        self._pending = {"tool": action.tool, "tool_input": action.tool_input}
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        if self._pending is None:
+            return
+        self.steps.append({**self._pending, "observation": str(output)})
+        self._pending = None
+        self.store.save(self.run_id, {
+            "kind": "agent",
+            "instruction": self.instruction,
+            "steps": self.steps,
+            "results": [step["observation"] for step in self.steps],
+            **capture_browser_state(self.browser),
+        })
+
+    def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        self._pending = None
+
+def build_resume_input(instruction: str, checkpoint: Dict[str, Any], max_observation_chars: int = 500) -> str:
+    """Build an agent input that continues an instruction after the checkpoint's completed steps."""
+    lines = [
+        instruction,
+        "",
+        "This task was interrupted and is being resumed. The browser is already on "
+        f"{checkpoint.get('url')}. These steps were already completed; do not repeat them:",
+    ]
+    for index, step in enumerate(checkpoint.get("steps", []), start=1):
+        observation = step["observation"]
+        if len(observation) > max_observation_chars:
+            observation = observation[:max_observation_chars] + "..."
+        lines.append(f"{index}. {step['tool']} {json.dumps(step['tool_input'])} -> {observation}")
+    return "\n".join(lines)
+
+def run_agent_with_checkpoints(
+    agent: Any,
+    instruction: str,
+    browser: Any,
+    store: CheckpointStore,
+    run_id: str,
+    resume: bool = True,
+) -> Dict[str, Any]:
+    """Run a ReAct agent, saving a checkpoint after each completed tool call.
+
+    If a checkpoint exists for the run and resume is True, the browser state is restored
+    and the agent is told which steps were already completed. The checkpoint is deleted
+    once the agent finishes.
+
+    Args:
+        agent: Agent created by create_browser_agent, using tools bound to the browser.
+        instruction: The user's instruction.
+        browser: Synchronous browser shared by the agent's tools.
+        store: Store the checkpoints are saved to.
+        run_id: Identifier of the run.
+        resume: Whether to resume from an existing checkpoint.
+
+    Returns:
+        The agent's result.
+    """
+    if not resume:
+        store.delete(run_id)
+    checkpoint = store.load(run_id)
+    agent_input = instruction
+
+    if checkpoint and checkpoint.get("kind") == "agent" and checkpoint.get("steps"):
+        restore_browser_state(browser, checkpoint)
+        agent_input = build_resume_input(instruction, checkpoint)
+        print(f"Resuming run {run_id} after {len(checkpoint['steps'])} completed steps")
+
+    handler = AgentCheckpointHandler(browser, store, run_id, instruction)
+    result = agent.invoke({"input": agent_input}, config={"callbacks": [handler]})
+    store.delete(run_id)
+    return result
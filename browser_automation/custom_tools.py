@@ -9,7 +9,8 @@ from typing import Dict, Any, Optional, Type
 from langchain.tools.base import BaseTool, ToolException
 
 # カスタムユーティリティをインポート
-from .playwright_utils import create_custom_sync_playwright_browser, get_current_page
+from domain_scheduler import scheduled_action
+from playwright_utils import create_custom_sync_playwright_browser, get_current_page
 
 class FormInputTool(BaseTool):
     """Tool to enter text into a form field."""
@@ -75,7 +76,7 @@ class WaitAndClickTool(BaseTool):
         try:
             page = get_current_page(self.sync_browser)
             page.wait_for_selector(selector, timeout=timeout)
-            page.click(selector)
+            scheduled_action(page, lambda: page.click(selector))
             return f"Successfully waited for and clicked element with selector '{selector}'"
         except Exception as e:
             raise ToolException(f"Error waiting for or clicking element: {str(e)}")
@@ -197,8 +198,10 @@ class SubmitFormTool(BaseTool):
         """
         try:
             page = get_current_page(self.sync_browser)
-            with page.expect_navigation():
-                page.evaluate(f"document.querySelector('{selector}').submit()")
+            def submit() -> None:
+                with page.expect_navigation():
+                    page.evaluate(f"document.querySelector('{selector}').submit()")
+            scheduled_action(page, submit)
             return f"Successfully submitted form with selector '{selector}'"
         except Exception as e:
             raise ToolException(f"Error submitting form: {str(e)}")
@@ -0,0 +1,375 @@
+"""
+Per-Domain Navigation Scheduler
+
+This module puts a scheduler in front of page navigations so that concurrent runs do not
+overload the same site. Each domain has a concurrency cap and a token-bucket rate limit,
+and backs off adaptively when it answers with 429 or 503. Navigations to other domains
+are not held up in the meantime.
+
+Navigations are gated where they are issued, with scheduled_goto, rather than by routing
+requests, because routing disables the browser's HTTP cache and would send every
+subresource request through Python. Actions that may navigate without a URL, such as
+clicks, form submissions and going back, are gated on the current page's domain with
+scheduled_action.
+"""
+
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+from urllib.parse import urlparse
+
+THROTTLE_STATUSES = (429, 503)
+
+T = TypeVar("T")
+
+# スケジューラを設定したブラウザコンテキスト（scheduled_gotoが参照する）
+_context_schedulers: "weakref.WeakKeyDictionary[Any, DomainScheduler]" = weakref.WeakKeyDictionary()
+
+URL_PATTERN = re.compile(r"https?://[^\s'\"<>]+|(?:[a-z0-9-]+\.)+[a-z]{2,}", re.IGNORECASE)
+
+def domain_of(url: str) -> str:
+    """Return the domain a URL is scheduled under."""
+    if "://" not in url:
+        url = f"https://{url}"
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+def guess_domain(text: str) -> Optional[str]:
+    """Return the domain of the first URL or host name mentioned in a piece of text, if any."""
+    match = URL_PATTERN.search(text)
+    return domain_of(match.group(0)) if match else None
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class DomainBusyError(TimeoutError):
+    """Raised when a navigation does not get its domain's slot in time, e.g. while the domain backs off."""
+
+    def __init__(self, domain: str, retry_after: float):
+        super().__init__(f"Domain {domain} is busy or backing off")
+        self.domain = domain
+        self.retry_after = retry_after
+
+def find_domain_busy_error(error: BaseException) -> Optional[DomainBusyError]:
+    """Return the DomainBusyError that caused an error, if any.
+
+    Wrapping errors such as FlowExecutionError are followed through their "error" attribute
+    and their cause.
+    """
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        if isinstance(current, DomainBusyError):
+            return current
+        seen.add(id(current))
+        current = getattr(current, "error", None) or current.__cause__ or current.__context__
+    return None
+
+def is_domain_busy(error: BaseException) -> bool:
+    """Return whether an error was caused by a navigation the scheduler did not let through."""
+    return find_domain_busy_error(error) is not None
+
+class TokenBucket:
+    """Token-bucket rate limiter. Not thread-safe; callers hold the scheduler's lock."""
+
+    def __init__(self, rate: float, capacity: float):
+        """Initialize the bucket.
+
+        Args:
+            rate: Tokens added per second.
+            capacity: Maximum number of tokens, i.e. the allowed burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Return the seconds until a token is available."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        """Consume a token. Call only after wait_time returned 0."""
+        self._refill(now)
+        self.tokens -= 1
+
+class DomainState:
+    """Scheduling state of one domain."""
+
+    def __init__(self, max_concurrency: int, rate: float, burst: float, base_backoff: float):
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.active = 0
+        self.blocked_until = 0.0
+        self.backoff = base_backoff
+        self.throttled = 0
+        self.navigations = 0
+
+class DomainScheduler:
+    """Enforce per-domain concurrency caps, rate limits and adaptive backoff for navigations.
+
+    One scheduler is shared by every browser in the process, and it is thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 2,
+        requests_per_second: float = 1.0,
+        burst: float = 3.0,
+        base_backoff: float = 5.0,
+        max_backoff: float = 300.0,
+        max_wait: float = 20.0,
+        domain_limits: Optional[Dict[str, Dict[str, float]]] = None,
+    ):
+        """Initialize the scheduler.
+
+        Args:
+            max_concurrency: Maximum number of navigations in flight per domain.
+            requests_per_second: Sustained navigation rate per domain.
+            burst: Number of navigations allowed in a burst per domain.
+            base_backoff: Initial backoff in seconds after a 429 or 503 response.
+            max_backoff: Upper bound of the backoff, which doubles on each throttled response.
+            max_wait: Seconds a navigation waits for its domain before DomainBusyError is raised.
+            domain_limits: Optional per-domain overrides of max_concurrency,
+                requests_per_second and burst.
+        """
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+        self.domain_limits = domain_limits or {}
+        self._domains: Dict[str, DomainState] = {}
+        self._condition = threading.Condition()
+
+    def _state(self, domain: str) -> DomainState:
+        state = self._domains.get(domain)
+        if state is None:
+            limits = self.domain_limits.get(domain, {})
+            state = DomainState(
+                max_concurrency=int(limits.get("max_concurrency", self.max_concurrency)),
+                rate=limits.get("requests_per_second", self.requests_per_second),
+                burst=limits.get("burst", self.burst),
+                base_backoff=self.base_backoff,
+            )
+            self._domains[domain] = state
+        return state
+
+    def acquire(self, url: str, timeout: Optional[float] = None) -> bool:
+        """Wait until a navigation to the URL's domain is allowed and reserve a slot for it.
+
+        Args:
+            url: URL being navigated to.
+            timeout: Maximum seconds to wait. Defaults to max_wait.
+
+        Returns:
+            True if a slot was reserved, False if the domain did not become available in time.
+        """
+        domain = domain_of(url)
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+
+        with self._condition:
+            state = self._state(domain)
+            while True:
+                now = time.monotonic()
+                wall_now = time.time()
+                if state.blocked_until > wall_now:
+                    wait: Optional[float] = state.blocked_until - wall_now
+                elif state.active >= state.max_concurrency:
+                    wait = None
+                else:
+                    wait = state.bucket.wait_time(now)
+                    if wait == 0:
+                        state.bucket.take(now)
+                        state.active += 1
+                        state.navigations += 1
+                        return True
+
+                remaining = deadline - now
+                if remaining <= 0 or (wait is not None and wait > remaining):
+                    return False
+                # 同時実行数の上限に達している場合はrelease()による通知を待つ
+                self._condition.wait(timeout=remaining if wait is None else wait)
+
+    def release(self, url: str) -> None:
+        """Release a slot reserved by acquire."""
+        with self._condition:
+            state = self._state(domain_of(url))
+            state.active = max(0, state.active - 1)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, url: str, timeout: Optional[float] = None) -> Iterator[None]:
+        """Hold a navigation slot for a URL's domain for the duration of a block.
+
+        Raises:
+            DomainBusyError: If the domain does not become available in time.
+        """
+        if not self.acquire(url, timeout=timeout):
+            raise DomainBusyError(domain_of(url), self.retry_after(url))
+        try:
+            yield
+        finally:
+            self.release(url)
+
+    def report(self, url: str, status: int, retry_after: Optional[float] = None) -> None:
+        """Record the response status of a navigation and adapt the domain's backoff.
+
+        A 429 or 503 blocks the domain for the Retry-After time or the current backoff,
+        whichever is longer, and doubles the backoff. Other responses reset it.
+        """
+        with self._condition:
+            state = self._state(domain_of(url))
+            if status in THROTTLE_STATUSES:
+                delay = max(state.backoff, retry_after or 0.0)
+                state.blocked_until = max(state.blocked_until, time.time() + delay)
+                state.backoff = min(self.max_backoff, state.backoff * 2)
+                state.throttled += 1
+                print(f"Domain {domain_of(url)} answered {status}; backing off for {delay:.0f}s")
+            elif status < 400:
+                state.backoff = self.base_backoff
+            self._condition.notify_all()
+
+    def retry_after(self, url: str) -> float:
+        """Return the seconds until the URL's domain stops backing off, or 0 if it is available."""
+        with self._condition:
+            state = self._domains.get(domain_of(url))
+            if state is None:
+                return 0.0
+            return max(0.0, state.blocked_until - time.time())
+
+    def install(self, context: Any) -> None:
+        """Use the scheduler for a Playwright browser context.
+
+        scheduled_goto calls on the context's pages wait for their domain's slot, and 429 and
+        503 responses to main-frame navigations, including those caused by clicks, make the
+        domain back off. No requests are routed, so the HTTP cache stays enabled.
+        Installing on the same context twice has no effect.
+        """
+        if _context_schedulers.get(context) is self:
+            return
+        _context_schedulers[context] = self
+
+        def on_response(response: Any) -> None:
+            request = response.request
+            if not request.is_navigation_request() or request.frame.parent_frame is not None:
+                return
+            self.report(response.url, response.status, parse_retry_after(response.headers.get("retry-after")))
+
+        context.on("response", on_response)
+
+    def attach(self, browser: Any) -> None:
+        """Install the scheduler on a browser's current context and on every context that replaces it.
+
+        Args:
+            browser: Browser created by create_custom_sync_playwright_browser.
+        """
+        if self.install not in browser.context_hooks:
+            browser.context_hooks.append(self.install)
+        self.install(browser.context)
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Return the scheduling state of every domain seen so far."""
+        with self._condition:
+            now = time.time()
+            return {
+                domain: {
+                    "active": state.active,
+                    "max_concurrency": state.max_concurrency,
+                    "navigations": state.navigations,
+                    "throttled": state.throttled,
+                    "backoff_seconds": state.backoff,
+                    "blocked_for_seconds": round(max(0.0, state.blocked_until - now), 1),
+                }
+                for domain, state in self._domains.items()
+            }
+
+def scheduled_goto(page: Any, url: str, **kwargs: Any) -> Any:
+    """Navigate a page to a URL, waiting for the domain's slot if the page's context has a scheduler.
+
+    Args:
+        page: The synchronous Playwright page to navigate.
+        url: URL to navigate to.
+        **kwargs: Additional arguments for page.goto.
+
+    Returns:
+        The response of the navigation.
+
+    Raises:
+        DomainBusyError: If the domain does not become available within the scheduler's max_wait.
+    """
+    scheduler = _context_schedulers.get(page.context)
+    if scheduler is None:
+        return page.goto(url, **kwargs)
+    with scheduler.slot(url):
+        return page.goto(url, **kwargs)
+
+def scheduled_action(page: Any, action: Callable[[], T]) -> T:
+    """Run a page action that may navigate, such as a click, in a slot for the page's current domain.
+
+    The destination of a click or form submission is not known beforehand, so the action is
+    scheduled under the domain the page is on, and is refused while that domain backs off.
+
+    Args:
+        page: The synchronous Playwright page the action operates on.
+        action: Function performing the action.
+
+    Returns:
+        The return value of the action.
+
+    Raises:
+        DomainBusyError: If the domain does not become available within the scheduler's max_wait.
+    """
+    scheduler = _context_schedulers.get(page.context)
+    # about:blankなど、ドメインのないページでの操作は制御しない
+    if scheduler is None or not page.url.startswith(("http://", "https://")):
+        return action()
+    with scheduler.slot(page.url):
+        return action()
+
+def test_domain_scheduler():
+    """Test rate limiting and backoff without a browser."""
+    scheduler = DomainScheduler(max_concurrency=1, requests_per_second=2.0, burst=1.0, max_wait=2.0)
+
+    started = time.monotonic()
+    for _ in range(3):
+        with scheduler.slot("https://example.com/page"):
+            pass
+    print(f"3 navigations at 2/s took {time.monotonic() - started:.2f}s")
+
+    scheduler.report("https://example.com/", 429, retry_after=30)
+    print(f"example.com available in {scheduler.retry_after('https://example.com'):.0f}s")
+    print(f"Acquire while backing off: {scheduler.acquire('https://www.example.com', timeout=0.1)}")
+    print(f"Acquire for another domain: {scheduler.acquire('https://python.org', timeout=0.1)}")
+    try:
+        with scheduler.slot("https://example.com/next", timeout=0.1):
+            pass
+    except DomainBusyError as e:
+        print(f"Slot refused: {str(e)}, retry after {e.retry_after:.0f}s")
+    print("Metrics:", scheduler.metrics())
+
+    print("\nDomain scheduler test completed!")
+
+if __name__ == "__main__":
+    test_domain_scheduler()
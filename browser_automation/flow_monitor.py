@@ -0,0 +1,231 @@
+"""
+Flow Change Monitoring
+
+This module runs a browser operation flow as a recurring monitor. Each ExtractOperation's
+content is split into page regions whose hashes are kept between runs. When no region has
+changed, the downstream FilterOperations and the LLM are skipped; when something has
+changed, only a diff of the changed regions is passed on.
+"""
+
+import difflib
+import hashlib
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from browser_flow import BrowserFlow, ExtractOperation, FilterOperation
+
+# 表示されている要素ごとにキーとテキストを取得するスクリプト
+# キーは位置ではなくIDまたはタグ名とクラス名から作るため、要素が挿入されてもずれない
+REGIONS_SCRIPT = """
+elements => elements
+    .filter(element => !['SCRIPT', 'STYLE', 'TEMPLATE', 'NOSCRIPT'].includes(element.tagName))
+    .filter(element => element.getClientRects().length > 0 || getComputedStyle(element).display === 'contents')
+    .map(element => ({
+        key: element.id ? '#' + element.id : [element.tagName.toLowerCase(), ...element.classList].join('.'),
+        text: element.innerText || ''
+    }))
+"""
+
+# セレクタ指定がない場合はbody直下の要素を領域として扱う
+FULL_PAGE_REGION_SELECTOR = "body > *"
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+def content_hash(text: str) -> str:
+    """Return a hash of text that ignores whitespace-only differences."""
+    return hashlib.sha256(_normalize(text).encode("utf-8")).hexdigest()
+
+def extract_regions(page: Any, selector: Optional[str] = None) -> Dict[str, str]:
+    """Return the text of each rendered region matched by a selector, in page order.
+
+    Regions are keyed by element ID, or by tag and class names. Regions that share a key
+    are numbered by occurrence, e.g. "div.card:2".
+    """
+    elements = page.eval_on_selector_all(selector or FULL_PAGE_REGION_SELECTOR, REGIONS_SCRIPT)
+    regions: Dict[str, str] = {}
+    occurrences: Dict[str, int] = {}
+    for element in elements:
+        if not element["text"].strip():
+            continue
+        occurrences[element["key"]] = occurrences.get(element["key"], 0) + 1
+        count = occurrences[element["key"]]
+        regions[element["key"] if count == 1 else f"{element['key']}:{count}"] = element["text"]
+    return regions
+
+def _changed_region(key: str, old_text: str, new_text: str) -> Dict[str, str]:
+    diff = difflib.unified_diff(old_text.splitlines(), new_text.splitlines(), lineterm="", n=1)
+    return {"region": key, "status": "changed", "diff": "\n".join(list(diff)[2:])}
+
+def diff_regions(previous: Dict[str, Dict[str, str]], current: Dict[str, str]) -> List[Dict[str, str]]:
+    """Compare the stored regions of the last run with the current ones.
+
+    Regions are aligned as sequences of content hashes, so a region inserted before others
+    is reported as added without the following regions being reported as changed. Within
+    a span that differs, regions are paired by key first and then by position.
+
+    Args:
+        previous: Stored regions in page order, keyed by region, each with "hash" and "text".
+        current: Current region texts in page order, keyed by region.
+
+    Returns:
+        A list of changes with the region key, a status of added, removed or changed, and a diff.
+    """
+    previous_keys = list(previous)
+    current_keys = list(current)
+    matcher = difflib.SequenceMatcher(
+        None,
+        [previous[key]["hash"] for key in previous_keys],
+        [content_hash(current[key]) for key in current_keys],
+        autojunk=False
+    )
+
+    changes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        old_keys = previous_keys[i1:i2]
+        new_keys = current_keys[j1:j2]
+        for key in [key for key in new_keys if key in old_keys]:
+            changes.append(_changed_region(key, previous[key]["text"], current[key]))
+            old_keys.remove(key)
+            new_keys.remove(key)
+        # 残りは位置順に対応付け、余った領域を追加・削除とする
+        for old_key, new_key in zip(old_keys, new_keys):
+            changes.append(_changed_region(new_key, previous[old_key]["text"], current[new_key]))
+        for key in new_keys[len(old_keys):]:
+            changes.append({"region": key, "status": "added", "diff": current[key]})
+        for key in old_keys[len(new_keys):]:
+            changes.append({"region": key, "status": "removed", "diff": previous[key]["text"]})
+    return changes
+
+def format_changes(changes: List[Dict[str, str]]) -> str:
+    """Format region changes as text for the downstream operations and the LLM."""
+    return "\n\n".join(f"[{change['status']}] {change['region']}\n{change['diff']}" for change in changes)
+
+class MonitorStateStore:
+    """Store region hashes of monitored flows as JSON files in a directory."""
+
+    def __init__(self, directory: str = "monitor_state"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key_for(self, flow: BrowserFlow) -> str:
+        """Return the state key of a flow. Changing the flow's operations starts a new state."""
+        digest = hashlib.sha256(json.dumps(flow.to_dict()["operations"], sort_keys=True).encode("utf-8")).hexdigest()
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in flow.name)[:50]
+        return f"{safe_name}-{digest[:12]}"
+
+    def load(self, key: str) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.directory, f"{key}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, key: str, state: Dict[str, Any]) -> None:
+        path = os.path.join(self.directory, f"{key}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+class MonitorResult:
+    """Outcome of one monitoring run."""
+
+    def __init__(self, changed: bool, changes: List[Dict[str, str]], results: List[str], output: Any = None):
+        self.changed = changed
+        self.changes = changes
+        self.results = results
+        self.output = output
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the result to a dictionary."""
+        return {
+            "changed": self.changed,
+            "changes": self.changes,
+            "results": self.results,
+            "output": self.output
+        }
+
+class FlowMonitor:
+    """Run a flow repeatedly, acting only on the page regions that changed since the last run."""
+
+    def __init__(self, flow: BrowserFlow, store: Optional[MonitorStateStore] = None):
+        """Initialize the monitor.
+
+        Args:
+            flow: The flow to monitor.
+            store: Store for region hashes between runs. Defaults to the monitor_state directory.
+        """
+        self.flow = flow
+        self.store = store or MonitorStateStore()
+        self.key = self.store.key_for(flow)
+
+    def run(self, page: Any, on_change: Optional[Callable[[str], Any]] = None) -> MonitorResult:
+        """Run the flow once and compare its extracted regions with the previous run.
+
+        Filters that follow an unchanged extraction are skipped, while navigations, clicks
+        and later extractions still run. The first run reports every region as added.
+
+        Args:
+            page: The synchronous Playwright page to operate on.
+            on_change: Optional function, e.g. an LLM call, called with the formatted changes
+                only when something changed. Its return value is stored as the result's output.
+
+        Returns:
+            The monitoring result.
+        """
+        state = self.store.load(self.key)
+        new_state: Dict[str, Any] = {}
+        all_changes: List[Dict[str, str]] = []
+        results: List[str] = []
+        # 直前の抽出操作で変更があったか（フィルターはその結果にのみ適用する）
+        last_extract_changed = False
+
+        for index, operation in enumerate(self.flow.operations):
+            if isinstance(operation, ExtractOperation):
+                current = extract_regions(page, operation.selector)
+                changes = diff_regions(state.get(str(index), {}), current)
+                new_state[str(index)] = {
+                    key: {"hash": content_hash(text), "text": text} for key, text in current.items()
+                }
+                last_extract_changed = bool(changes)
+                if changes:
+                    all_changes.extend(changes)
+                    results.append(format_changes(changes))
+            elif isinstance(operation, FilterOperation):
+                if last_extract_changed:
+                    output = operation.execute(page, results)
+                    if output is not None:
+                        results.append(output)
+            else:
+                output = operation.execute(page, results)
+                if output is not None:
+                    results.append(output)
+
+        self.store.save(self.key, new_state)
+
+        changed = bool(all_changes)
+        output = on_change(format_changes(all_changes)) if changed and on_change else None
+        return MonitorResult(changed=changed, changes=all_changes, results=results, output=output)
+
+def test_diff_regions():
+    """Test region diffing with snapshots of a page."""
+    first = {"#price": "Price: 100", "#news": "Nothing new", "div.card": "Card A", "div.card:2": "Card B"}
+    previous = {key: {"hash": content_hash(text), "text": text} for key, text in first.items()}
+
+    print("Unchanged:", diff_regions(previous, dict(first)))
+    print("Changed:", format_changes(diff_regions(previous, {**first, "#price": "Price: 120", "#news": "Nothing  new"})))
+
+    # 先頭にカードが挿入されても、既存のカードは変更として報告されない
+    inserted = {"#price": "Price: 100", "#news": "Nothing new", "div.card": "Card New", "div.card:2": "Card A", "div.card:3": "Card B"}
+    changes = diff_regions(previous, inserted)
+    print("Inserted:", changes)
+    assert [(change["region"], change["status"]) for change in changes] == [("div.card", "added")]
+
+    print("\nMonitor diff test completed!")
+
+if __name__ == "__main__":
+    test_diff_regions()
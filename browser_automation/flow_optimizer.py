@@ -0,0 +1,331 @@
+"""
+Browser Flow Optimizer
+
+This module rewrites a browser operation flow into a cheaper equivalent before execution.
+Each rule removes or merges wasteful operations, and the optimizer reports the
+estimated cost of the flow before and after the rewrite.
+"""
+
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple, Any
+from urllib.parse import urlparse
+
+from browser_flow import (
+    BrowserFlow,
+    BrowserOperation,
+    NavigateOperation,
+    SearchOperation,
+    ClickOperation,
+    ExtractOperation,
+    create_google_search_flow,
+)
+
+# 操作ごとの推定コスト（ミリ秒）
+OPERATION_COSTS: Dict[str, int] = {
+    "NavigateOperation": 1500,
+    "SearchOperation": 150,
+    "ClickOperation": 400,
+    "ExtractOperation": 300,
+    "FilterOperation": 50,
+}
+
+# よく使うサイトの本文セレクタ（全体抽出の絞り込みに使う）
+DEFAULT_EXTRACT_SELECTORS: Dict[str, str] = {
+    "google.com": "#search",
+    "wikipedia.org": "#mw-content-text",
+    "en.wikipedia.org": "#mw-content-text",
+    "ja.wikipedia.org": "#mw-content-text",
+    "news.ycombinator.com": "#hnmain",
+    "github.com": "main",
+    "stackoverflow.com": "#mainbar",
+    "docs.python.org": "div.body",
+}
+
+FULL_PAGE_EXTRACT_COST = 1200
+SEARCH_SUBMIT_COST = 50
+
+SUBMIT_SELECTOR_PATTERN = re.compile(
+    r"type=['\"]?submit|btnK|submit|search[-_]?button",
+    re.IGNORECASE,
+)
+
+def load_extract_selectors(path: Optional[str] = None) -> Dict[str, str]:
+    """Return the hostname to content selector map used to narrow full-page extractions.
+
+    The built-in selectors are extended, and overridden, by a JSON object read from path,
+    which defaults to the EXTRACT_SELECTORS_FILE environment variable.
+    """
+    selectors = dict(DEFAULT_EXTRACT_SELECTORS)
+    path = path or os.getenv("EXTRACT_SELECTORS_FILE")
+    if path:
+        try:
+            with open(path, encoding="utf-8") as f:
+                selectors.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Could not load extract selectors from {path}: {str(e)}")
+    return selectors
+
+def estimate_operation_cost(operation: BrowserOperation) -> int:
+    """Estimate the cost of a single operation in milliseconds."""
+    cost = OPERATION_COSTS.get(operation.__class__.__name__, 0)
+    if isinstance(operation, ExtractOperation) and not operation.selector:
+        cost = FULL_PAGE_EXTRACT_COST
+    if isinstance(operation, SearchOperation) and operation.submit:
+        cost += SEARCH_SUBMIT_COST
+    return cost
+
+def estimate_flow_cost(flow: BrowserFlow) -> int:
+    """Estimate the cost of a whole flow in milliseconds."""
+    return sum(estimate_operation_cost(op) for op in flow.operations)
+
+def _changes_page(operation: BrowserOperation) -> bool:
+    """Return True if the operation may leave the current page."""
+    if isinstance(operation, ClickOperation):
+        return True
+    if isinstance(operation, SearchOperation):
+        return operation.submit
+    return False
+
+class OptimizationRule:
+    """Base class for flow optimization rules."""
+
+    name = "base"
+
+    def apply(self, operations: List[BrowserOperation]) -> List[BrowserOperation]:
+        """Return a rewritten copy of the operation list."""
+        raise NotImplementedError
+
+class RemoveRedundantNavigationRule(OptimizationRule):
+    """Drop navigations that are immediately overridden or that revisit the current page."""
+
+    name = "remove_redundant_navigation"
+
+    def apply(self, operations: List[BrowserOperation]) -> List[BrowserOperation]:
+        result: List[BrowserOperation] = []
+        current_url: Optional[str] = None
+
+        for op in operations:
+            if isinstance(op, NavigateOperation):
+                if op.url == current_url:
+                    continue
+                if result and isinstance(result[-1], NavigateOperation):
+                    result.pop()
+                current_url = op.url
+            elif _changes_page(op):
+                current_url = None
+            result.append(op)
+
+        return result
+
+class MergeSearchSubmitRule(OptimizationRule):
+    """Replace a search followed by a click on a submit button with a single Enter keypress."""
+
+    name = "merge_search_submit"
+
+    def _is_submit_click(self, operation: BrowserOperation) -> bool:
+        if not isinstance(operation, ClickOperation):
+            return False
+        if SUBMIT_SELECTOR_PATTERN.search(operation.selector):
+            return True
+        description = operation.description.lower()
+        return "search button" in description or "submit" in description
+
+    def apply(self, operations: List[BrowserOperation]) -> List[BrowserOperation]:
+        result: List[BrowserOperation] = []
+
+        for op in operations:
+            previous = result[-1] if result else None
+            if (
+                isinstance(previous, SearchOperation)
+                and not previous.submit
+                and self._is_submit_click(op)
+            ):
+                result[-1] = SearchOperation(
+                    selector=previous.selector,
+                    keyword=previous.keyword,
+                    submit=True
+                )
+                continue
+            result.append(op)
+
+        return result
+
+class NarrowExtractRule(OptimizationRule):
+    """Narrow full-page extractions to a known content selector for the current site."""
+
+    name = "narrow_extract"
+
+    def __init__(self, extract_selectors: Dict[str, str]):
+        self.extract_selectors = extract_selectors
+
+    def apply(self, operations: List[BrowserOperation]) -> List[BrowserOperation]:
+        result: List[BrowserOperation] = []
+        current_host: Optional[str] = None
+
+        for op in operations:
+            if isinstance(op, NavigateOperation):
+                current_host = urlparse(op.url).hostname
+            elif _changes_page(op):
+                current_host = None
+            elif isinstance(op, ExtractOperation) and not op.selector and current_host:
+                # "www."の有無は区別しない
+                host = current_host[4:] if current_host.startswith("www.") else current_host
+                selector = self.extract_selectors.get(current_host) or self.extract_selectors.get(host)
+                if selector:
+                    op = ExtractOperation(selector=selector)
+            result.append(op)
+
+        return result
+
+class RemoveDuplicateExtractRule(OptimizationRule):
+    """Drop an extraction that repeats the previous one on the same page."""
+
+    name = "remove_duplicate_extract"
+
+    def apply(self, operations: List[BrowserOperation]) -> List[BrowserOperation]:
+        result: List[BrowserOperation] = []
+
+        for op in operations:
+            previous = result[-1] if result else None
+            if (
+                isinstance(op, ExtractOperation)
+                and isinstance(previous, ExtractOperation)
+                and op.selector == previous.selector
+            ):
+                continue
+            result.append(op)
+
+        return result
+
+class OptimizationReport:
+    """Summary of an optimization pass."""
+
+    def __init__(self, original_cost: int, optimized_cost: int, applied_rules: List[str]):
+        self.original_cost = original_cost
+        self.optimized_cost = optimized_cost
+        self.applied_rules = applied_rules
+
+    @property
+    def saving(self) -> int:
+        """Estimated saving in milliseconds."""
+        return self.original_cost - self.optimized_cost
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the report to a dictionary."""
+        return {
+            "original_cost": self.original_cost,
+            "optimized_cost": self.optimized_cost,
+            "saving": self.saving,
+            "applied_rules": self.applied_rules
+        }
+
+class FlowOptimizer:
+    """Apply a set of rules to a flow until no rule changes it any more."""
+
+    def __init__(
+        self,
+        rules: Optional[List[OptimizationRule]] = None,
+        extract_selectors: Optional[Dict[str, str]] = None,
+        max_passes: int = 5,
+    ):
+        """Initialize the optimizer.
+
+        Args:
+            rules: Rules to apply. Defaults to the built-in rule set.
+            extract_selectors: Mapping of hostname to content selector used to narrow full-page
+                extractions. Defaults to load_extract_selectors().
+            max_passes: Maximum number of passes over the rule set.
+        """
+        if rules is None:
+            rules = [
+                RemoveRedundantNavigationRule(),
+                MergeSearchSubmitRule(),
+                NarrowExtractRule(load_extract_selectors() if extract_selectors is None else extract_selectors),
+                RemoveDuplicateExtractRule(),
+            ]
+        self.rules = rules
+        self.max_passes = max_passes
+
+    def optimize(self, flow: BrowserFlow) -> Tuple[BrowserFlow, OptimizationReport]:
+        """Rewrite the flow into a cheaper equivalent.
+
+        Args:
+            flow: The flow to optimize. It is not modified.
+
+        Returns:
+            A tuple of the optimized flow and a report of the estimated costs.
+        """
+        operations = list(flow.operations)
+        applied_rules: List[str] = []
+
+        for _ in range(self.max_passes):
+            changed = False
+            for rule in self.rules:
+                rewritten = rule.apply(operations)
+                if [op.to_dict() for op in rewritten] != [op.to_dict() for op in operations]:
+                    operations = rewritten
+                    changed = True
+                    if rule.name not in applied_rules:
+                        applied_rules.append(rule.name)
+            if not changed:
+                break
+
+        optimized = BrowserFlow(name=flow.name, description=flow.description)
+        for op in operations:
+            optimized.add_operation(op)
+
+        report = OptimizationReport(
+            original_cost=estimate_flow_cost(flow),
+            optimized_cost=estimate_flow_cost(optimized),
+            applied_rules=applied_rules
+        )
+        return optimized, report
+
+def optimize_flow(
+    flow: BrowserFlow,
+    extract_selectors: Optional[Dict[str, str]] = None,
+) -> Tuple[BrowserFlow, OptimizationReport]:
+    """Optimize a flow with the built-in rule set."""
+    return FlowOptimizer(extract_selectors=extract_selectors).optimize(flow)
+
+def test_optimizer():
+    """Test the optimizer on the Google search flow and a Wikipedia extraction flow."""
+    flow = create_google_search_flow("LangChain Playwright tutorial")
+    flow.operations.insert(0, NavigateOperation(url="https://www.google.com"))
+
+    optimized, report = optimize_flow(flow)
+
+    print("Original flow:")
+    print(flow.to_json())
+    print("\nOptimized flow:")
+    print(optimized.to_json())
+    print(f"\nEstimated cost: {report.original_cost}ms -> {report.optimized_cost}ms")
+    print(f"Applied rules: {', '.join(report.applied_rules)}")
+
+    assert [op.to_dict()["type"] for op in optimized.operations] == [
+        "NavigateOperation", "SearchOperation", "ClickOperation", "ExtractOperation"
+    ]
+    assert optimized.operations[1].submit
+    assert optimized.operations[3].selector is None
+    assert (report.original_cost, report.optimized_cost) == (5150, 3300)
+    assert report.applied_rules == ["remove_redundant_navigation", "merge_search_submit"]
+
+    wiki = BrowserFlow(name="Wikipedia article", description="Extract an article")
+    wiki.add_operation(NavigateOperation(url="https://en.wikipedia.org/wiki/Playwright"))
+    wiki.add_operation(ExtractOperation())
+    wiki.add_operation(ExtractOperation())
+
+    optimized, report = optimize_flow(wiki)
+    print(f"\nWikipedia flow: {report.original_cost}ms -> {report.optimized_cost}ms ({', '.join(report.applied_rules)})")
+
+    assert len(optimized.operations) == 2
+    assert optimized.operations[1].selector == "#mw-content-text"
+    assert (report.original_cost, report.optimized_cost) == (3900, 1800)
+    assert report.applied_rules == ["narrow_extract", "remove_duplicate_extract"]
+
+    print("\nOptimizer test completed!")
+
+if __name__ == "__main__":
+    test_optimizer()
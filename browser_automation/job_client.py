@@ -0,0 +1,103 @@
+"""
+Job Server Client
+
+This module provides a small HTTP client for the headless job server,
+used by the Streamlit app and by other programmatic clients.
+"""
+
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Optional
+
+class JobClient:
+    """Client for submitting jobs to the job server and fetching their results."""
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8000", timeout: float = 10.0):
+        """Initialize the client.
+
+        Args:
+            base_url: Base URL of the job server.
+            timeout: Timeout in seconds for each HTTP request.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            f"{self.base_url}{path}",
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            detail = json.loads(e.read() or b"{}").get("error", e.reason)
+            raise RuntimeError(f"Job server returned {e.code}: {detail}")
+
+    def submit_instruction(self, instruction: str, mode: str = "react", priority: int = 0) -> int:
+        """Submit a natural-language instruction and return the job ID."""
+        return self._request("POST", "/jobs", {"instruction": instruction, "mode": mode, "priority": priority})["id"]
+
+    def submit_flow(self, flow: Dict[str, Any], priority: int = 0, optimize: bool = True) -> int:
+        """Submit a browser operation flow dictionary and return the job ID.
+
+        The flow is optimized before it runs unless optimize is False.
+        """
+        return self._request("POST", "/jobs", {"flow": flow, "priority": priority, "optimize": optimize})["id"]
+
+    def submit_monitor(
+        self,
+        flow: Dict[str, Any],
+        instruction: Optional[str] = None,
+        priority: int = 0,
+        optimize: bool = True,
+    ) -> int:
+        """Submit a flow as a monitoring run that only reports changes since the previous run.
+
+        Args:
+            flow: Browser operation flow dictionary.
+            instruction: Optional instruction the LLM applies to the changes, only when something changed.
+            priority: Higher priorities are claimed first.
+            optimize: Whether to optimize the flow before it runs.
+
+        Returns:
+            The job ID.
+        """
+        body = {"flow": flow, "monitor": True, "instruction": instruction, "priority": priority, "optimize": optimize}
+        return self._request("POST", "/jobs", body)["id"]
+
+    def retry(self, job_id: int) -> None:
+        """Requeue a failed job so that it resumes from its last checkpoint."""
+        self._request("POST", f"/jobs/{job_id}/retry", {})
+
+    def status(self, job_id: int) -> Dict[str, Any]:
+        """Return the status of a job."""
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def result(self, job_id: int) -> Dict[str, Any]:
+        """Return a job including its result, which is None until the job has finished."""
+        return self._request("GET", f"/jobs/{job_id}/result")
+
+    def health(self) -> Dict[str, Any]:
+        """Return worker and queue statistics."""
+        return self._request("GET", "/health")
+
+    def wait(self, job_id: int, poll_interval: float = 1.0, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Wait until a job has finished and return it with its result.
+
+        Raises:
+            TimeoutError: If the job has not finished within the timeout.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            job = self.result(job_id)
+            if job["status"] in ("succeeded", "failed"):
+                return job
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"Job {job_id} did not finish within {timeout} seconds")
+            time.sleep(poll_interval)
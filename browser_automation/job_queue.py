@@ -0,0 +1,238 @@
+"""
+Persistent Job Queue
+
+This module provides a local job queue backed by SQLite for the headless job server.
+Jobs are claimed by priority and then by submission order, and survive server restarts.
+"""
+
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+# 以前のバージョンで作成したデータベースに追加する列
+ADDED_COLUMNS = {
+    "not_before": "REAL NOT NULL DEFAULT 0",
+    "deferrals": "INTEGER NOT NULL DEFAULT 0",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    not_before REAL NOT NULL DEFAULT 0,
+    deferrals INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, id);
+"""
+
+class JobQueue:
+    """A persistent job queue stored in a SQLite database."""
+
+    def __init__(self, path: str = "jobs.db"):
+        """Initialize the queue and create the database schema if needed.
+
+        Args:
+            path: Path of the SQLite database file.
+        """
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            for column, definition in ADDED_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # スレッド間で共有しないよう、操作ごとに接続を作成する
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _to_dict(self, row: sqlite3.Row, include_result: bool = True) -> Dict[str, Any]:
+        job = {
+            "id": row["id"],
+            "kind": row["kind"],
+            "payload": json.loads(row["payload"]),
+            "priority": row["priority"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "deferrals": row["deferrals"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "error": row["error"],
+        }
+        if include_result:
+            job["result"] = json.loads(row["result"]) if row["result"] is not None else None
+        return job
+
+    def submit(self, kind: str, payload: Dict[str, Any], priority: int = 0) -> int:
+        """Add a job to the queue.
+
+        Args:
+            kind: Kind of job, e.g. "instruction" or "flow".
+            payload: JSON-serializable job input.
+            priority: Higher priorities are claimed first.
+
+        Returns:
+            The ID of the new job.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, payload, priority, created_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload), priority, time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Mark the next queued job as running and return it, or None if no job is ready.
+
+        Jobs deferred with defer are not claimed before their time.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND not_before <= ? "
+                    "ORDER BY priority DESC, id LIMIT 1",
+                    (time.time(),)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (time.time(), row["id"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def complete(self, job_id: int, result: Any) -> None:
+        """Mark a job as succeeded and store its result."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, finished_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id)
+            )
+
+    def fail(self, job_id: int, error: str) -> None:
+        """Mark a job as failed and store the error message."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id)
+            )
+
+    def defer(self, job_id: int, until: float) -> None:
+        """Put a running job back in the queue so that it is not claimed again before a time.
+
+        The claim is not counted as an attempt, but as a deferral, so callers can cap how
+        often a job is deferred.
+
+        Args:
+            job_id: ID of the job.
+            until: Unix time before which the job is not claimed.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, not_before = ?, "
+                "attempts = MAX(attempts - 1, 0), deferrals = deferrals + 1 WHERE id = ?",
+                (until, job_id)
+            )
+
+    def retry(self, job_id: int) -> bool:
+        """Put a failed job back in the queue.
+
+        Returns:
+            True if the job was requeued, False if it does not exist or has not failed.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, finished_at = NULL, deferrals = 0 "
+                "WHERE id = ? AND status = 'failed'",
+                (job_id,)
+            )
+            return cursor.rowcount == 1
+
+    def requeue_running(self) -> int:
+        """Put jobs left running by a previous server process back in the queue.
+
+        Returns:
+            The number of jobs requeued.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+            return cursor.rowcount
+
+    def get(self, job_id: int, include_result: bool = True) -> Optional[Dict[str, Any]]:
+        """Return a job by ID, or None if it does not exist."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row, include_result) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Return the most recent jobs, optionally filtered by status, without their results."""
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row, include_result=False) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of jobs in each status."""
+        counts = {status: 0 for status in JOB_STATUSES}
+        with self._connect() as conn:
+            for row in conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"):
+                counts[row["status"]] = row["count"]
+        return counts
+
+def test_job_queue():
+    """Test the job queue with a temporary database."""
+    import os
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    queue = JobQueue(path)
+    low = queue.submit("instruction", {"instruction": "Go to example.com"}, priority=0)
+    high = queue.submit("instruction", {"instruction": "Go to python.org"}, priority=5)
+
+    job = queue.claim()
+    print(f"Claimed job {job['id']} (expected {high})")
+    queue.complete(job["id"], {"output": "done"})
+
+    print(f"Requeued {queue.requeue_running()} running jobs")
+    deferred = queue.claim()
+    queue.defer(deferred["id"], time.time() + 60)
+    print(f"Claim after deferring job {deferred['id']}: {queue.claim()} (expected None)")
+    queue.defer(deferred["id"], 0)
+    print(f"Next job: {queue.claim()['id']} (expected {low})")
+    print("Counts:", queue.counts())
+
+    print("\nJob queue test completed!")
+
+if __name__ == "__main__":
+    test_job_queue()
@@ -0,0 +1,461 @@
+"""
+Headless Job Server
+
+This module runs the browser automation tool as a headless HTTP service.
+Clients submit instructions or flows, which are stored in a persistent job queue and
+processed by a fixed pool of workers, each of which owns one browser.
+
+Endpoints:
+    POST /jobs              Submit {"instruction": ..., "mode": "react" | "plan"} or {"flow": {...}},
+                            with an optional "priority". Flows submitted with "monitor": true only
+                            report the regions that changed since the previous run, and are
+                            summarised with the optional "instruction" only when something changed.
+                            Flows are optimized before they run unless "optimize" is false, and
+                            the optimizer's report is stored in the result.
+    POST /jobs/<id>/retry   Requeue a failed job, which resumes from its last checkpoint.
+    GET  /jobs              List recent jobs, optionally filtered with ?status=.
+    GET  /jobs/<id>         Get the status of a job.
+    GET  /jobs/<id>/result  Get the result of a finished job.
+    GET  /health            Get worker and queue statistics.
+    GET  /metrics           Get browser memory and recycling metrics for each worker, and the
+                            navigation scheduler's state for each domain.
+
+All workers share one DomainScheduler, so navigations to the same site are capped and rate
+limited across workers. Jobs whose site is backing off after a 429 or 503 response, or whose
+navigation the scheduler did not let through, are deferred up to max_deferrals times, and
+the workers move on to jobs for other sites in the meantime.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from agent_setup import create_browser_agent, create_llm, create_plan_execute_agent
+from browser_flow import BrowserFlow, NavigateOperation
+from browser_watchdog import BrowserWatchdog
+from checkpoint import CheckpointStore, run_agent_with_checkpoints, run_flow_with_checkpoints
+from custom_tools import create_custom_tools
+from domain_scheduler import DomainScheduler, find_domain_busy_error, guess_domain
+from flow_monitor import FlowMonitor, MonitorStateStore
+from flow_optimizer import optimize_flow
+from job_queue import JobQueue
+from langchain_setup import create_playwright_toolkit
+from playwright_utils import (
+    close_sync_browser,
+    create_custom_sync_playwright_browser,
+    reset_browser_context,
+)
+from scratchpad import ScratchpadManager
+
+AGENT_MODES = ("react", "plan")
+
+def parse_job_request(body: Dict[str, Any]) -> Tuple[str, Dict[str, Any], int]:
+    """Validate a job submission.
+
+    Returns:
+        A tuple of the job kind, its payload and its priority.
+
+    Raises:
+        ValueError: If the submission is invalid.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+
+    priority = body.get("priority", 0)
+    if not isinstance(priority, int):
+        raise ValueError("'priority' must be an integer")
+
+    if "flow" in body:
+        if not isinstance(body["flow"], dict):
+            raise ValueError("'flow' must be a JSON object")
+        BrowserFlow.from_dict(body["flow"])
+        optimize = body.get("optimize", True)
+        if not isinstance(optimize, bool):
+            raise ValueError("'optimize' must be a boolean")
+        if body.get("monitor"):
+            instruction = body.get("instruction")
+            if instruction is not None and not isinstance(instruction, str):
+                raise ValueError("'instruction' must be a string")
+            return "monitor", {"flow": body["flow"], "instruction": instruction, "optimize": optimize}, priority
+        return "flow", {"flow": body["flow"], "optimize": optimize}, priority
+
+    instruction = body.get("instruction")
+    if not isinstance(instruction, str) or not instruction.strip():
+        raise ValueError("Either 'instruction' or 'flow' is required")
+    mode = body.get("mode", "react")
+    if mode not in AGENT_MODES:
+        raise ValueError(f"'mode' must be one of: {', '.join(AGENT_MODES)}")
+    return "instruction", {"instruction": instruction, "mode": mode}, priority
+
+def job_domain(job: Dict[str, Any]) -> Optional[str]:
+    """Return the domain a job navigates to first, if it can be determined before running it."""
+    payload = job["payload"]
+    if "flow" in payload:
+        for operation in BrowserFlow.from_dict(payload["flow"]).operations:
+            if isinstance(operation, NavigateOperation):
+                return guess_domain(operation.url)
+        return None
+    return guess_domain(payload.get("instruction", ""))
+
+class JobWorker(threading.Thread):
+    """Worker thread that owns one browser and processes jobs from the queue one at a time."""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        checkpoints: CheckpointStore,
+        index: int,
+        watchdog_options: Optional[Dict[str, Any]] = None,
+        browser_profile: Optional[str] = None,
+        user_data_dir: Optional[str] = None,
+        monitor_state: Optional[MonitorStateStore] = None,
+        scheduler: Optional[DomainScheduler] = None,
+        max_deferrals: int = 10,
+        poll_interval: float = 1.0,
+    ):
+        super().__init__(name=f"job-worker-{index}", daemon=True)
+        self.scheduler = scheduler or DomainScheduler()
+        self.max_deferrals = max_deferrals
+        self.monitor_state = monitor_state or MonitorStateStore()
+        self.browser_profile = browser_profile
+        # Chromiumはユーザーデータディレクトリをロックするため、ワーカーごとに分ける
+        self.user_data_dir = os.path.join(user_data_dir, self.name) if user_data_dir else None
+        self.queue = queue
+        self.checkpoints = checkpoints
+        self.watchdog = BrowserWatchdog(**(watchdog_options or {}))
+        self.poll_interval = poll_interval
+        self.current_job: Optional[int] = None
+        self.processed = 0
+        self.launch_error: Optional[str] = None
+        self._stop_event = threading.Event()
+        self._browser = None
+
+    def stop(self) -> None:
+        """Ask the worker to stop after its current job."""
+        self._stop_event.set()
+
+    def run(self) -> None:
+        # Playwright の同期APIは作成したスレッドでのみ使用できるため、ブラウザはワーカー内で作成する
+        self._browser = self._launch()
+        if self._browser is None:
+            return
+        try:
+            while not self._stop_event.is_set():
+                job = self.queue.claim()
+                if job is None:
+                    self._stop_event.wait(self.poll_interval)
+                    continue
+                self._process(job)
+        finally:
+            close_sync_browser(self._browser)
+
+    def _launch(self) -> Any:
+        """Launch the worker's browser, retrying with a growing delay until it starts or the worker stops.
+
+        Returns:
+            The browser, or None if the worker was stopped before a browser could be launched.
+        """
+        delay = 1.0
+        while not self._stop_event.is_set():
+            try:
+                browser = self.watchdog.watch(
+                    create_custom_sync_playwright_browser(profile=self.browser_profile, user_data_dir=self.user_data_dir)
+                )
+                self.launch_error = None
+                return browser
+            except Exception as e:
+                traceback.print_exc()
+                self.launch_error = str(e)
+                print(f"{self.name} could not launch a browser; retrying in {delay:.0f}s")
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, 60.0)
+        return None
+
+    def _process(self, job: Dict[str, Any]) -> None:
+        self.current_job = job["id"]
+        try:
+            domain = job_domain(job)
+            wait = self.scheduler.retry_after(domain) if domain else 0.0
+            if wait > 0:
+                self._defer(job, domain, wait)
+                return
+            # 再起動や再作成はジョブの合間にのみ行う
+            self._browser = self.watchdog.recycle_if_needed()
+            self.scheduler.attach(self._browser)
+            page = reset_browser_context(self._browser)
+            result = self.execute(job, page)
+            self.queue.complete(job["id"], result)
+            self.processed += 1
+        except Exception as e:
+            # スケジューラがナビゲーションを止めた場合のみ、失敗にせず後で再開する
+            busy = find_domain_busy_error(e)
+            if busy is not None:
+                self._defer(job, busy.domain, max(busy.retry_after, self.scheduler.base_backoff))
+                return
+            traceback.print_exc()
+            self.queue.fail(job["id"], str(e))
+            self.processed += 1
+        finally:
+            self.current_job = None
+
+    def _defer(self, job: Dict[str, Any], domain: str, wait: float) -> None:
+        if job["deferrals"] >= self.max_deferrals:
+            self.queue.fail(job["id"], f"Deferred {job['deferrals']} times while {domain} was busy or backing off")
+            self.processed += 1
+            return
+        print(f"Deferring job {job['id']} for {wait:.0f}s while {domain} is busy or backing off")
+        self.queue.defer(job["id"], time.time() + wait)
+
+    def execute(self, job: Dict[str, Any], page: Any) -> Dict[str, Any]:
+        """Execute a job with this worker's browser and return its result.
+
+        Progress is checkpointed after each step, so a retried or requeued job resumes
+        from its last completed step.
+        """
+        payload = job["payload"]
+        run_id = f"job-{job['id']}"
+
+        if job["kind"] in ("flow", "monitor"):
+            flow = BrowserFlow.from_dict(payload["flow"])
+            report = None
+            # 最適化は決定的なので、再開時も同じステップ列になりチェックポイントと整合する
+            if payload.get("optimize", True):
+                flow, report = optimize_flow(flow)
+            optimization = report.to_dict() if report else None
+
+        if job["kind"] == "flow":
+            results = run_flow_with_checkpoints(flow, self._browser, self.checkpoints, run_id)
+            return {"results": results, "optimization": optimization}
+
+        if job["kind"] == "monitor":
+            monitor = FlowMonitor(flow, self.monitor_state)
+            instruction = payload.get("instruction")
+            on_change = None
+            if instruction:
+                llm = create_llm()
+                on_change = lambda changes: llm.invoke(
+                    f"{instruction}\n\nChanges since the last check:\n{changes}"
+                ).content
+            return {**monitor.run(page, on_change=on_change).to_dict(), "optimization": optimization}
+
+        if payload.get("mode") == "plan":
+            agent = create_plan_execute_agent(
+                sync_browser=self._browser,
+                verbose=False,
+                checkpoint_store=self.checkpoints,
+                run_id=run_id
+            )
+            result = agent.invoke({"input": payload["instruction"]})
+            return {"output": result["output"], "flow": result["flow"], "llm_calls": result["llm_calls"]}
+
+        tools = (
+            create_playwright_toolkit(sync_browser=self._browser)
+            + create_custom_tools(sync_browser=self._browser)
+        )
+        agent = create_browser_agent(tools, verbose=False, scratchpad=ScratchpadManager())
+        result = run_agent_with_checkpoints(agent, payload["instruction"], self._browser, self.checkpoints, run_id)
+        return {"output": result["output"]}
+
+class JobServer:
+    """HTTP server that accepts jobs and processes them with a pool of browser workers."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        workers: int = 2,
+        db_path: str = "jobs.db",
+        checkpoint_dir: str = "checkpoints",
+        watchdog_options: Optional[Dict[str, Any]] = None,
+        browser_profile: Optional[str] = None,
+        user_data_dir: Optional[str] = None,
+        monitor_dir: str = "monitor_state",
+        scheduler_options: Optional[Dict[str, Any]] = None,
+        max_deferrals: int = 10,
+    ):
+        """Initialize the server.
+
+        Args:
+            host: Address to listen on.
+            port: Port to listen on.
+            workers: Number of workers, which is also the number of browsers kept open.
+            db_path: Path of the SQLite job database.
+            checkpoint_dir: Directory job checkpoints are saved to.
+            watchdog_options: Keyword arguments for each worker's BrowserWatchdog.
+            browser_profile: Name of the launch profile for the workers' browsers.
+            user_data_dir: Optional directory for persistent browser profiles, one per worker.
+            monitor_dir: Directory the region hashes of monitoring flows are kept in.
+            scheduler_options: Keyword arguments for the DomainScheduler shared by the workers.
+            max_deferrals: Number of times a job is deferred while its domain is busy or backing
+                off before it fails.
+        """
+        self.queue = JobQueue(db_path)
+        self.checkpoints = CheckpointStore(checkpoint_dir)
+        self.monitor_state = MonitorStateStore(monitor_dir)
+        self.scheduler = DomainScheduler(**(scheduler_options or {}))
+        self.workers: List[JobWorker] = [
+            JobWorker(
+                self.queue,
+                self.checkpoints,
+                index,
+                watchdog_options=watchdog_options,
+                browser_profile=browser_profile,
+                user_data_dir=user_data_dir,
+                monitor_state=self.monitor_state,
+                scheduler=self.scheduler,
+                max_deferrals=max_deferrals
+            )
+            for index in range(workers)
+        ]
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+
+    def _make_handler(self):
+        server = self
+
+        class JobRequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: Any) -> None:
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                parts = [part for part in urlparse(self.path).path.split("/") if part]
+                if len(parts) == 3 and parts[0] == "jobs" and parts[1].isdigit() and parts[2] == "retry":
+                    if server.queue.retry(int(parts[1])):
+                        self._send_json(200, {"id": int(parts[1]), "status": "queued"})
+                    else:
+                        self._send_json(409, {"error": "Only failed jobs can be retried"})
+                    return
+                if parts != ["jobs"]:
+                    self._send_json(404, {"error": "Not found"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                    kind, payload, priority = parse_job_request(body)
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                job_id = server.queue.submit(kind, payload, priority)
+                self._send_json(201, {"id": job_id, "status": "queued"})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = [part for part in url.path.split("/") if part]
+
+                if parts == ["health"]:
+                    self._send_json(200, server.health())
+                elif parts == ["metrics"]:
+                    self._send_json(200, server.metrics())
+                elif parts == ["jobs"]:
+                    status = parse_qs(url.query).get("status", [None])[0]
+                    self._send_json(200, {"jobs": server.queue.list(status=status)})
+                elif len(parts) in (2, 3) and parts[0] == "jobs" and parts[1].isdigit():
+                    if len(parts) == 3 and parts[2] != "result":
+                        self._send_json(404, {"error": "Not found"})
+                        return
+                    job = server.queue.get(int(parts[1]), include_result=len(parts) == 3)
+                    if job is None:
+                        self._send_json(404, {"error": "Job not found"})
+                    elif len(parts) == 3 and job["status"] in ("queued", "running"):
+                        self._send_json(202, job)
+                    else:
+                        self._send_json(200, job)
+                else:
+                    self._send_json(404, {"error": "Not found"})
+
+        return JobRequestHandler
+
+    def health(self) -> Dict[str, Any]:
+        """Return worker and queue statistics."""
+        return {
+            "workers": [
+                {
+                    "name": worker.name,
+                    "alive": worker.is_alive(),
+                    "current_job": worker.current_job,
+                    "processed": worker.processed,
+                    "launch_error": worker.launch_error
+                }
+                for worker in self.workers
+            ],
+            "queue": self.queue.counts(),
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return browser memory and recycling metrics for each worker and the state of each domain."""
+        return {
+            "workers": {
+                worker.name: worker.watchdog.metrics() if worker.watchdog.browser else None
+                for worker in self.workers
+            },
+            "domains": self.scheduler.metrics(),
+            "queue": self.queue.counts(),
+        }
+
+    def serve_forever(self) -> None:
+        """Start the workers and serve HTTP requests until interrupted."""
+        requeued = self.queue.requeue_running()
+        if requeued:
+            print(f"Requeued {requeued} jobs left running by a previous server.")
+
+        for worker in self.workers:
+            worker.start()
+
+        host, port = self.httpd.server_address[:2]
+        print(f"Job server listening on http://{host}:{port} with {len(self.workers)} workers")
+        try:
+            self.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        """Stop the HTTP server and the workers."""
+        self.httpd.server_close()
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.join(timeout=30)
+        print("Job server stopped.")
+
+def run_job_server(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    workers: int = 2,
+    db_path: str = "jobs.db",
+    checkpoint_dir: str = "checkpoints",
+    watchdog_options: Optional[Dict[str, Any]] = None,
+    browser_profile: Optional[str] = None,
+    user_data_dir: Optional[str] = None,
+    scheduler_options: Optional[Dict[str, Any]] = None,
+    max_deferrals: int = 10,
+) -> None:
+    """Run the headless job server until interrupted."""
+    JobServer(
+        host=host,
+        port=port,
+        workers=workers,
+        db_path=db_path,
+        checkpoint_dir=checkpoint_dir,
+        watchdog_options=watchdog_options,
+        browser_profile=browser_profile,
+        user_data_dir=user_data_dir,
+        scheduler_options=scheduler_options,
+        max_deferrals=max_deferrals
+    ).serve_forever()
+
+if __name__ == "__main__":
+    run_job_server()
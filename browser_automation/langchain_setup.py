@@ -1,6 +1,9 @@
 import os
+from functools import partial
 from typing import List, Optional
+from urllib.parse import urlparse
 
+from langchain.callbacks.manager import CallbackManagerForToolRun
 from langchain.tools.base import BaseTool
 from langchain_community.tools.playwright.click import ClickTool
 from langchain_community.tools.playwright.current_page import CurrentWebPageTool
@@ -9,23 +12,62 @@ from langchain_community.tools.playwright.extract_text import ExtractTextTool
 from langchain_community.tools.playwright.get_elements import GetElementsTool
 from langchain_community.tools.playwright.navigate import NavigateTool
 from langchain_community.tools.playwright.navigate_back import NavigateBackTool
+from langchain_community.tools.playwright.utils import get_current_page as get_tool_page
 
 # カスタムユーティリティをインポート
-from .playwright_utils import create_custom_sync_playwright_browser, get_current_page
+from playwright_utils import create_custom_sync_playwright_browser, get_current_page
+from domain_scheduler import scheduled_action, scheduled_goto
 
-def create_playwright_toolkit() -> List[BaseTool]:
+class ScheduledNavigateTool(NavigateTool):
+    """NavigateTool that waits for the domain's slot when a DomainScheduler is installed on the browser."""
+    
+    def _run(self, url: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        """Navigate the current page to a URL."""
+        if self.sync_browser is None:
+            raise ValueError(f"Synchronous browser not provided to {self.name}")
+        if urlparse(url).scheme not in ("http", "https"):
+            raise ValueError("URL scheme must be 'http' or 'https'")
+        page = get_tool_page(self.sync_browser)
+        response = scheduled_goto(page, url)
+        status = response.status if response else "unknown"
+        return f"Navigating to {url} returned status code {status}"
+
+class ScheduledClickTool(ClickTool):
+    """ClickTool that clicks in a slot for the current page's domain when a DomainScheduler is installed."""
+    
+    def _run(self, selector: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        """Click an element on the current page."""
+        if self.sync_browser is None:
+            raise ValueError(f"Synchronous browser not provided to {self.name}")
+        page = get_tool_page(self.sync_browser)
+        return scheduled_action(page, partial(super()._run, selector, run_manager=run_manager))
+
+class ScheduledNavigateBackTool(NavigateBackTool):
+    """NavigateBackTool that goes back in a slot for the current page's domain when a DomainScheduler is installed."""
+    
+    def _run(self, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        """Navigate back to the previous page."""
+        if self.sync_browser is None:
+            raise ValueError(f"Synchronous browser not provided to {self.name}")
+        page = get_tool_page(self.sync_browser)
+        return scheduled_action(page, partial(super()._run, run_manager=run_manager))
+
+def create_playwright_toolkit(sync_browser=None) -> List[BaseTool]:
     """Create a toolkit of Playwright tools for browser automation.
     
+    Args:
+        sync_browser: Optional synchronous browser instance to share with other tools
+        
     Returns:
         List[BaseTool]: A list of Playwright tools for browser automation.
     """
     # カスタムブラウザを使用
-    sync_browser = create_custom_sync_playwright_browser(headless=True, slow_mo=50)
+    sync_browser = sync_browser or create_custom_sync_playwright_browser(headless=True, slow_mo=50)
     
     tools = [
-        NavigateTool(sync_browser=sync_browser),
-        NavigateBackTool(sync_browser=sync_browser),
-        ClickTool(sync_browser=sync_browser),
+        ScheduledNavigateTool(sync_browser=sync_browser),
+        ScheduledNavigateBackTool(sync_browser=sync_browser),
+        ScheduledClickTool(sync_browser=sync_browser),
         ExtractTextTool(sync_browser=sync_browser),
         ExtractHyperlinksTool(sync_browser=sync_browser),
         GetElementsTool(sync_browser=sync_browser),
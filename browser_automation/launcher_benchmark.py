@@ -0,0 +1,100 @@
+"""
+Launch Profile Benchmark
+
+This script compares the browser launch profiles by measuring how long each takes to
+launch and to reach first paint on a page. With --persistent, every profile is measured
+twice against the same user data directory, so the cold and warm cache runs can be compared.
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from browser_launcher import PROFILES
+from playwright_utils import close_sync_browser, create_custom_sync_playwright_browser
+
+# ナビゲーション開始からの最初の描画時間（ミリ秒）を取得するスクリプト
+FIRST_PAINT_SCRIPT = """
+() => {
+    const entry = performance.getEntriesByName('first-contentful-paint')[0]
+        || performance.getEntriesByName('first-paint')[0];
+    return entry ? entry.startTime : null;
+}
+"""
+
+def measure_profile(profile: str, url: str, user_data_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Launch a browser with a profile and measure launch and first-paint times.
+
+    Returns:
+        A dictionary with the launch, navigation and first-paint times in milliseconds.
+    """
+    started = time.perf_counter()
+    browser = create_custom_sync_playwright_browser(profile=profile, user_data_dir=user_data_dir)
+    launched = time.perf_counter()
+    try:
+        browser.page.goto(url, wait_until="load")
+        loaded = time.perf_counter()
+        first_paint = browser.page.evaluate(FIRST_PAINT_SCRIPT)
+    finally:
+        close_sync_browser(browser)
+
+    return {
+        "profile": profile,
+        "launch_ms": round((launched - started) * 1000),
+        "load_ms": round((loaded - launched) * 1000),
+        "first_paint_ms": round(first_paint) if first_paint is not None else None,
+    }
+
+def run_benchmark(
+    url: str = "https://example.com",
+    profiles: Optional[List[str]] = None,
+    runs: int = 3,
+    persistent: bool = False,
+) -> List[Dict[str, Any]]:
+    """Measure each profile several times and print a summary table.
+
+    Args:
+        url: Page to load in each run.
+        profiles: Names of the profiles to compare. Defaults to the headless profiles.
+        runs: Number of runs per profile.
+        persistent: Whether to reuse one user data directory per profile, so that runs after
+            the first start with a warm cache.
+
+    Returns:
+        The measurements of every run.
+    """
+    profiles = profiles or [name for name, profile in PROFILES.items() if profile.headless]
+    measurements = []
+
+    for profile in profiles:
+        user_data_dir = tempfile.mkdtemp(prefix=f"benchmark-{profile}-") if persistent else None
+        try:
+            for run in range(runs):
+                result = measure_profile(profile, url, user_data_dir)
+                result["run"] = run + 1
+                result["cache"] = ("cold" if run == 0 else "warm") if persistent else "none"
+                measurements.append(result)
+        finally:
+            if user_data_dir:
+                shutil.rmtree(user_data_dir, ignore_errors=True)
+
+    print(f"\n{'profile':<16}{'run':>5}{'cache':>7}{'launch ms':>11}{'load ms':>9}{'first paint ms':>16}")
+    for result in measurements:
+        first_paint = result["first_paint_ms"] if result["first_paint_ms"] is not None else "-"
+        print(
+            f"{result['profile']:<16}{result['run']:>5}{result['cache']:>7}"
+            f"{result['launch_ms']:>11}{result['load_ms']:>9}{first_paint:>16}"
+        )
+    return measurements
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare browser launch profiles")
+    parser.add_argument("--url", default="https://example.com", help="Page to load in each run")
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), help="Profiles to compare")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs per profile")
+    parser.add_argument("--persistent", action="store_true", help="Reuse a user data directory to compare cold and warm caches")
+    args = parser.parse_args()
+
+    run_benchmark(url=args.url, profiles=args.profiles, runs=args.runs, persistent=args.persistent)
@@ -2,9 +2,10 @@
 Main entry point for the Browser Automation Tool
 
 This script serves as the main entry point for the Browser Automation Tool.
-It provides a simple command-line interface to run the Streamlit app.
+It provides a simple command-line interface to run the Streamlit app or the headless job server.
 """
 
+import argparse
 import os
 import subprocess
 import sys
@@ -46,8 +47,62 @@ def run_streamlit_app():
     print("Starting the Browser Automation Tool...")
     subprocess.run(["streamlit", "run", "streamlit_app.py"])
 
+def run_job_server(args):
+    """Run the headless job server."""
+    print("Starting the Browser Automation job server...")
+    from job_server import run_job_server as serve
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        db_path=args.db,
+        checkpoint_dir=args.checkpoints,
+        watchdog_options={
+            "max_context_pages": args.max_context_pages,
+            "max_browser_pages": args.max_browser_pages,
+            "max_browser_age_minutes": args.max_browser_age,
+            "max_rss_mb": args.max_rss,
+        },
+        browser_profile=args.profile,
+        user_data_dir=args.user_data_dir,
+        scheduler_options={
+            "max_concurrency": args.domain_concurrency,
+            "requests_per_second": args.domain_rate,
+            "burst": args.domain_burst,
+        },
+        max_deferrals=args.max_deferrals
+    )
+
+def parse_args():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Browser Automation Tool")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    subparsers.add_parser("app", help="Run the Streamlit app (default)")
+    
+    serve_parser = subparsers.add_parser("serve", help="Run the headless job server")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8000, help="Port to listen on")
+    serve_parser.add_argument("--workers", type=int, default=2, help="Number of browser workers")
+    serve_parser.add_argument("--db", default="jobs.db", help="Path of the SQLite job database")
+    serve_parser.add_argument("--checkpoints", default="checkpoints", help="Directory for job checkpoints")
+    serve_parser.add_argument("--profile", default=None, help="Browser launch profile (fast-headless, debug, low-memory)")
+    serve_parser.add_argument("--user-data-dir", default=None, help="Directory for persistent browser profiles and caches")
+    serve_parser.add_argument("--max-context-pages", type=int, default=50, help="Recycle a browser context after this many page loads")
+    serve_parser.add_argument("--max-browser-pages", type=int, default=500, help="Restart a browser after this many page loads")
+    serve_parser.add_argument("--max-browser-age", type=float, default=60.0, help="Restart a browser after this many minutes")
+    serve_parser.add_argument("--max-rss", type=float, default=1024.0, help="Restart a browser above this memory use in MB")
+    serve_parser.add_argument("--domain-concurrency", type=int, default=2, help="Maximum concurrent navigations per domain")
+    serve_parser.add_argument("--domain-rate", type=float, default=1.0, help="Navigations per second allowed per domain")
+    serve_parser.add_argument("--domain-burst", type=float, default=3.0, help="Navigations allowed in a burst per domain")
+    serve_parser.add_argument("--max-deferrals", type=int, default=10, help="Fail a job after deferring it this many times for a busy domain")
+    
+    return parser.parse_args()
+
 def main():
     """Main function to run the app."""
+    args = parse_args()
+    
     print("Browser Automation Tool")
     print("======================")
     
@@ -55,6 +110,11 @@ def main():
         print("\nEnvironment check failed. Please fix the issues before running the app.")
         return
     
+    if args.command == "serve":
+        print("\nEnvironment check passed. Starting the job server...")
+        run_job_server(args)
+        return
+    
     print("\nEnvironment check passed. Starting the app...")
     run_streamlit_app()
 
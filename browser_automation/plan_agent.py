@@ -0,0 +1,292 @@
+"""
+Plan-and-Execute Agent
+
+This module provides an agent that asks the model once for a complete browser operation
+flow, validates it against the available operation types, and executes it deterministically.
+The model is only consulted again to re-plan from a failing step and to answer from the
+extracted content, so most tasks finish in one or two LLM calls.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from langchain.schema import HumanMessage, SystemMessage
+
+from browser_flow import (
+    OPERATION_TYPES,
+    BrowserFlow,
+    BrowserOperation,
+    FlowExecutionError,
+    validate_operation_dict,
+)
+from checkpoint import CheckpointStore, capture_browser_state, restore_browser_state
+from domain_scheduler import is_domain_busy
+from flow_optimizer import load_extract_selectors, optimize_flow
+from playwright_utils import get_current_page
+
+PLAN_SYSTEM_PROMPT = """You control a web browser by writing a complete plan of browser operations.
+Reply with a single JSON object and nothing else, in this format:
+{"name": "<short name>", "description": "<what the plan does>", "operations": [<operation>, ...]}
+
+Each operation is an object with a "type" and its fields:
+- {"type": "NavigateOperation", "url": "<absolute URL>"}
+- {"type": "SearchOperation", "selector": "<CSS selector of the input>", "keyword": "<text>", "submit": true}
+- {"type": "ClickOperation", "selector": "<CSS selector>", "description": "<what is clicked>"}
+- {"type": "ExtractOperation", "selector": "<optional CSS selector>"}
+- {"type": "FilterOperation", "criteria": "<keywords to keep>"}
+
+Extract only the content needed to answer the instruction, using a selector where you can."""
+
+REPLAN_SYSTEM_PROMPT = """You control a web browser with a plan of browser operations, and one operation failed.
+Reply with a single JSON object and nothing else, in this format:
+{"operations": [<operation>, ...]}
+The operations replace the failed operation and everything after it. Use the same operation
+format as the original plan."""
+
+ANSWER_SYSTEM_PROMPT = """You answer the user's instruction using only the content extracted from web pages.
+Be concise."""
+
+def _parse_json_reply(text: str) -> Any:
+    """Parse a JSON object from a model reply, tolerating Markdown code fences."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end == -1:
+        raise ValueError("The reply does not contain a JSON object")
+    return json.loads(text[start:end + 1])
+
+def _validate_operations(operations: Any) -> List[str]:
+    if not isinstance(operations, list) or not operations:
+        return ["'operations' must be a non-empty list"]
+    errors = []
+    for index, op_data in enumerate(operations):
+        errors.extend(f"Operation {index}: {error}" for error in validate_operation_dict(op_data))
+    return errors
+
+class PlanAndExecuteAgent:
+    """Agent that plans a whole BrowserFlow in one LLM call and executes it deterministically."""
+
+    def __init__(
+        self,
+        llm: Any,
+        sync_browser: Any,
+        verbose: bool = True,
+        max_replans: int = 2,
+        optimize: bool = True,
+        checkpoint_store: Optional[CheckpointStore] = None,
+        run_id: Optional[str] = None,
+        extract_selectors: Optional[Dict[str, str]] = None,
+    ):
+        """Initialize the agent.
+
+        Args:
+            llm: Chat model used for planning and answering.
+            sync_browser: Synchronous browser the flow is executed in.
+            verbose: Whether to print the plan and execution progress.
+            max_replans: Maximum number of additional LLM calls spent on fixing a plan.
+            optimize: Whether to run the flow optimizer on each plan before execution.
+            checkpoint_store: Optional store to save a checkpoint to after each completed operation.
+            run_id: Identifier of the run, required to save or resume checkpoints.
+            extract_selectors: Mapping of hostname to content selector the optimizer narrows
+                full-page extractions to. Defaults to load_extract_selectors().
+        """
+        self.llm = llm
+        self.sync_browser = sync_browser
+        self.verbose = verbose
+        self.max_replans = max_replans
+        self.optimize = optimize
+        self.checkpoint_store = checkpoint_store
+        self.run_id = run_id
+        self.extract_selectors = load_extract_selectors() if extract_selectors is None else extract_selectors
+        self.llm_calls = 0
+
+    def _ask(self, system_prompt: str, user_prompt: str) -> str:
+        self.llm_calls += 1
+        reply = self.llm.invoke([SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)])
+        return reply.content
+
+    def _log(self, message: str) -> None:
+        if self.verbose:
+            print(message)
+
+    def _prepare(self, flow: BrowserFlow) -> BrowserFlow:
+        if not self.optimize:
+            return flow
+        optimized, report = optimize_flow(flow, extract_selectors=self.extract_selectors)
+        if report.applied_rules:
+            self._log(f"Optimized plan: {report.original_cost}ms -> {report.optimized_cost}ms")
+        return optimized
+
+    def _save_checkpoint(self, flow: BrowserFlow, index: int, results: List[str]) -> None:
+        if self.checkpoint_store is None or self.run_id is None:
+            return
+        self.checkpoint_store.save(self.run_id, {
+            "kind": "flow",
+            "flow": flow.to_dict(),
+            "next_index": index + 1,
+            "results": results,
+            **capture_browser_state(self.sync_browser),
+        })
+
+    def _load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        if self.checkpoint_store is None or self.run_id is None:
+            return None
+        checkpoint = self.checkpoint_store.load(self.run_id)
+        if checkpoint and checkpoint.get("kind") == "flow":
+            return checkpoint
+        return None
+
+    def plan(self, instruction: str) -> BrowserFlow:
+        """Ask the model for a complete flow for the instruction.
+
+        Raises:
+            ValueError: If no valid plan is produced within the re-plan budget.
+        """
+        prompt = f"Instruction: {instruction}"
+        errors: List[str] = []
+
+        for _ in range(self.max_replans + 1):
+            if errors:
+                prompt = (
+                    f"Instruction: {instruction}\n\n"
+                    f"Your previous plan was invalid:\n- " + "\n- ".join(errors) + "\n\n"
+                    f"Available operation types: {', '.join(OPERATION_TYPES)}"
+                )
+            try:
+                data = _parse_json_reply(self._ask(PLAN_SYSTEM_PROMPT, prompt))
+            except ValueError as e:
+                errors = [f"Could not parse the reply as JSON: {str(e)}"]
+                continue
+
+            errors = _validate_operations(data.get("operations") if isinstance(data, dict) else None)
+            if not errors:
+                try:
+                    return BrowserFlow.from_dict(data)
+                except ValueError as e:
+                    errors = [str(e)]
+
+        raise ValueError("Could not produce a valid plan: " + "; ".join(errors))
+
+    def replan(
+        self,
+        instruction: str,
+        flow: BrowserFlow,
+        failure: FlowExecutionError,
+        errors: Optional[List[str]] = None,
+    ) -> List[BrowserOperation]:
+        """Ask the model for replacement operations from the failing step onward.
+
+        Args:
+            instruction: The user's instruction.
+            flow: The flow that failed.
+            failure: The failure to re-plan from.
+            errors: Problems with the previous re-plan reply, if this is a retry.
+
+        Raises:
+            ValueError: If the reply is not a valid list of operations.
+        """
+        page = get_current_page(self.sync_browser)
+        completed = [op.to_dict() for op in flow.operations[:failure.index]]
+        prompt = (
+            f"Instruction: {instruction}\n\n"
+            f"Completed operations:\n{json.dumps(completed, indent=2)}\n\n"
+            f"Failed operation:\n{json.dumps(failure.operation.to_dict(), indent=2)}\n"
+            f"Error: {str(failure.error)}\n\n"
+            f"Current page: {page.url} ({page.title()})"
+        )
+        if errors:
+            prompt += (
+                f"\n\nYour previous reply was invalid:\n- " + "\n- ".join(errors) + "\n\n"
+                f"Available operation types: {', '.join(OPERATION_TYPES)}"
+            )
+        data = _parse_json_reply(self._ask(REPLAN_SYSTEM_PROMPT, prompt))
+        operations = data.get("operations") if isinstance(data, dict) else None
+        errors = _validate_operations(operations)
+        if errors:
+            raise ValueError("Invalid re-plan: " + "; ".join(errors))
+        return [BrowserOperation.from_dict(op_data) for op_data in operations]
+
+    def answer(self, instruction: str, results: List[str]) -> str:
+        """Answer the instruction from the extracted content."""
+        if not results:
+            return "The browser operations completed without extracting any content."
+        content = "\n\n---\n\n".join(results)
+        return self._ask(ANSWER_SYSTEM_PROMPT, f"Instruction: {instruction}\n\nExtracted content:\n{content}")
+
+    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Plan, execute and answer an instruction.
+
+        Args:
+            inputs: A dictionary with the instruction under "input", as for the ReAct agent.
+
+        Returns:
+            A dictionary with the answer under "output", the executed flow under "flow",
+            and the number of LLM calls made under "llm_calls".
+        """
+        instruction = inputs["input"]
+        self.llm_calls = 0
+
+        checkpoint = self._load_checkpoint()
+        if checkpoint:
+            # 前回の計画を再利用し、最後に完了した操作の次から再開する
+            flow = BrowserFlow.from_dict(checkpoint["flow"])
+            start = checkpoint["next_index"]
+            results: List[str] = checkpoint["results"]
+            page = restore_browser_state(self.sync_browser, checkpoint)
+            self._log(f"Resuming plan from operation {start}")
+        else:
+            flow = self._prepare(self.plan(instruction))
+            start = 0
+            results = []
+            page = get_current_page(self.sync_browser)
+            self._log(f"Plan:\n{flow.to_json()}")
+
+        replans = 0
+
+        while True:
+            try:
+                results = flow.run(
+                    page,
+                    start=start,
+                    results=results,
+                    on_step=lambda index, step_results: self._save_checkpoint(flow, index, step_results)
+                )
+                break
+            except FlowExecutionError as failure:
+                self._log(str(failure))
+                if is_domain_busy(failure):
+                    # 相手サイトの制限による失敗は計画を変えても解決しない
+                    raise
+                replacement = None
+                errors: List[str] = []
+                # 不正な再計画の応答も再計画の回数に含め、上限まで再試行する
+                while replacement is None:
+                    if replans >= self.max_replans:
+                        raise failure
+                    replans += 1
+                    try:
+                        replacement = self.replan(instruction, flow, failure, errors)
+                    except ValueError as e:
+                        errors = [str(e)]
+                        self._log(f"Invalid re-plan: {str(e)}")
+
+                fixed = BrowserFlow(name=flow.name, description=flow.description)
+                for op in flow.operations[:failure.index] + replacement:
+                    fixed.add_operation(op)
+                flow = fixed
+                start = failure.index
+                results = failure.results
+                self._log(f"Re-planned from operation {start}:\n{flow.to_json()}")
+
+        output = self.answer(instruction, results)
+        if self.checkpoint_store is not None and self.run_id is not None:
+            self.checkpoint_store.delete(self.run_id)
+        return {
+            "input": instruction,
+            "output": output,
+            "flow": flow.to_dict(),
+            "llm_calls": self.llm_calls
+        }
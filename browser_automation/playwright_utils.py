@@ -5,32 +5,292 @@ This module provides custom utilities for Playwright browser automation,
 specifically designed to work with Python 3.12+ and the latest versions of Playwright.
 """
 
-from typing import Any, Optional
-from playwright.sync_api import sync_playwright
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlparse
+from playwright.sync_api import Browser, sync_playwright
+
+from browser_launcher import DEFAULT_USER_DATA_DIR, get_profile
+
+try:
+    import psutil
+except ImportError:  # psutilがない場合は/procから直接読み取る
+    psutil = None
+
+# ドライバープロセスを特定するため、起動は同時に1つずつ行う
+_launch_lock = threading.Lock()
+
+def child_pids(pid: int) -> List[int]:
+    """Return the IDs of the direct child processes of a process."""
+    if psutil is not None:
+        try:
+            return [child.pid for child in psutil.Process(pid).children()]
+        except psutil.Error:
+            return []
+    
+    children = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # プロセス名に空白や括弧が含まれる場合があるため、最後の')'以降を解析する
+        fields = stat[stat.rfind(")") + 2:].split()
+        if len(fields) > 1 and int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """Return the total resident set size in bytes of a process and all its descendants.
+    
+    Returns None if memory usage cannot be read on this platform.
+    """
+    pids: List[int] = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        pending.extend(child_pids(current))
+    
+    total = 0
+    for current in pids:
+        if psutil is not None:
+            try:
+                total += psutil.Process(current).memory_info().rss
+            except psutil.Error:
+                continue
+        else:
+            try:
+                with open(f"/proc/{current}/statm") as f:
+                    total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            except (OSError, ValueError):
+                if current == pid:
+                    return None
+    return total
+
+# 永続コンテキストの初期化時に削除するストレージ（HTTPキャッシュは含まない）
+CLEARED_STORAGE_TYPES = "local_storage,indexeddb,websql,service_workers,cache_storage,file_systems"
+
+# 初期化時にストレージを削除するため、訪問したオリジンを記録するファイル
+VISITED_ORIGINS_FILE = "automation-visited-origins.json"
+
+def _origin(url: str) -> Optional[str]:
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return None
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+class PersistentContextBrowser(Browser):
+    """Browser stand-in for a persistent context launched with a user data directory.
+    
+    Playwright does not expose a Browser for persistent contexts, but the LangChain tools
+    require one. This wrapper presents the single persistent context through the parts of
+    the Browser interface the tools and utilities use. Other Browser methods raise
+    NotImplementedError or a descriptive AttributeError.
+    """
+    
+    # LangChainのPlaywrightツールはsync_browserをisinstance(Browser)で検証するため、
+    # ダックタイピングではなくBrowserのサブクラスにする必要がある
+    
+    def __init__(self, context: Any, user_data_dir: Optional[str] = None):
+        # Browserの初期化は行わず、永続コンテキストに処理を委譲する
+        self._persistent_context = context
+        self._closed = False
+        self._origins_path = os.path.join(user_data_dir, VISITED_ORIGINS_FILE) if user_data_dir else None
+        self._visited_origins: Set[str] = set()
+        if self._origins_path:
+            try:
+                with open(self._origins_path, encoding="utf-8") as f:
+                    self._visited_origins = set(json.load(f))
+            except (OSError, ValueError):
+                pass
+        context.on("close", lambda _: setattr(self, "_closed", True))
+        for page in context.pages:
+            page.on("framenavigated", self._record_origin)
+        context.on("page", lambda page: page.on("framenavigated", self._record_origin))
+    
+    def __repr__(self) -> str:
+        return f"<PersistentContextBrowser context={self._persistent_context!r}>"
+    
+    __str__ = __repr__
+    
+    @property
+    def _impl_obj(self) -> Any:
+        # オーバーライドしていないBrowserのメソッドはここで明示的に失敗させる
+        raise AttributeError("This Browser method is not available for a persistent context")
+    
+    def _record_origin(self, frame: Any) -> None:
+        origin = _origin(frame.url)
+        if origin is None or origin in self._visited_origins:
+            return
+        self._visited_origins.add(origin)
+        self._save_visited_origins()
+    
+    def _save_visited_origins(self) -> None:
+        if not self._origins_path:
+            return
+        try:
+            with open(self._origins_path, "w", encoding="utf-8") as f:
+                json.dump(sorted(self._visited_origins), f)
+        except OSError:
+            pass
+    
+    @property
+    def contexts(self) -> List[Any]:
+        return [] if self._closed else [self._persistent_context]
+    
+    @property
+    def version(self) -> str:
+        return ""
+    
+    @property
+    def browser_type(self) -> Any:
+        raise NotImplementedError("browser_type is not available for a persistent context")
+    
+    def is_connected(self) -> bool:
+        return not self._closed
+    
+    def on(self, event: str, f: Any) -> None:
+        """Listen for the "disconnected" event, which fires when the persistent context closes."""
+        if event != "disconnected":
+            raise NotImplementedError(f"Event '{event}' is not available for a persistent context")
+        self._persistent_context.on("close", lambda _: f(self))
+    
+    def once(self, event: str, f: Any) -> None:
+        """Listen once for the "disconnected" event, which fires when the persistent context closes."""
+        if event != "disconnected":
+            raise NotImplementedError(f"Event '{event}' is not available for a persistent context")
+        self._persistent_context.once("close", lambda _: f(self))
+    
+    def new_page(self, **kwargs: Any) -> Any:
+        """Open a new page in the persistent context. Context options cannot be changed."""
+        if kwargs:
+            raise NotImplementedError("A persistent context's options are fixed at launch")
+        return self._persistent_context.new_page()
+    
+    def new_browser_cdp_session(self) -> Any:
+        raise NotImplementedError("Use context.new_cdp_session(page) with a persistent context")
+    
+    def start_tracing(self, **kwargs: Any) -> None:
+        raise NotImplementedError("Use context.tracing with a persistent context")
+    
+    def stop_tracing(self, **kwargs: Any) -> bytes:
+        raise NotImplementedError("Use context.tracing with a persistent context")
+    
+    def new_context(self, storage_state: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        """Reset the persistent context instead of creating a new one.
+        
+        Pages, cookies, local storage, IndexedDB and other site storage of every visited origin
+        are discarded, but the on-disk HTTP and code caches are kept. The cookies and local
+        storage of a storage state are then restored.
+        """
+        context = self._persistent_context
+        for page in list(context.pages):
+            page.close()
+        context.clear_cookies()
+        
+        page = context.new_page()
+        try:
+            if self._visited_origins:
+                session = context.new_cdp_session(page)
+                for origin in sorted(self._visited_origins):
+                    session.send("Storage.clearDataForOrigin", {
+                        "origin": origin,
+                        "storageTypes": CLEARED_STORAGE_TYPES,
+                    })
+                session.detach()
+                self._visited_origins = set()
+                self._save_visited_origins()
+            
+            if storage_state and storage_state.get("cookies"):
+                context.add_cookies(storage_state["cookies"])
+            origins = [origin for origin in (storage_state or {}).get("origins", []) if origin.get("localStorage")]
+            if origins:
+                # Playwright本体と同様に、空のページで各オリジンを開いてlocalStorageを書き込む
+                page.route("**/*", lambda route: route.fulfill(status=200, content_type="text/html", body="<html></html>"))
+                for origin in origins:
+                    page.goto(origin["origin"])
+                    page.evaluate(
+                        "items => items.forEach(item => localStorage.setItem(item.name, item.value))",
+                        origin["localStorage"]
+                    )
+                page.unroute("**/*")
+        finally:
+            page.close()
+        return context
+    
+    def close(self, **kwargs: Any) -> None:
+        if not self._closed:
+            self._persistent_context.close()
 
 def create_custom_sync_playwright_browser(
-    headless: bool = False,  # デバッグのためデフォルトをFalseに
+    headless: Optional[bool] = None,
     slow_mo: Optional[int] = None,
+    profile: Optional[str] = None,
+    user_data_dir: Optional[str] = DEFAULT_USER_DATA_DIR,
 ) -> Any:
     """Create a synchronous Playwright browser with custom options.
     
     Args:
-        headless: Whether to run browser in headless mode. Default is False for debug.
-        slow_mo: Slow down operations by the specified amount of milliseconds. Default is None.
+        headless: Whether to run browser in headless mode. Default is taken from the profile.
+        slow_mo: Slow down operations by the specified amount of milliseconds. Default is taken from the profile.
+        profile: Name of the launch profile in browser_launcher. Default is BROWSER_PROFILE or "fast-headless".
+        user_data_dir: Optional directory for a persistent profile whose caches survive restarts.
+            Default is BROWSER_USER_DATA_DIR.
         
     Returns:
         A synchronous Playwright browser instance.
     """
-    print(f"Creating custom sync Playwright browser (headless={headless})...")
-    
-    playwright = sync_playwright().start()
-    browser = playwright.chromium.launch(
-        headless=headless,
-        slow_mo=slow_mo,
+    launch_profile = get_profile(profile)
+    options = launch_profile.launch_options(headless=headless, slow_mo=slow_mo)
+    print(
+        f"Creating custom sync Playwright browser "
+        f"(profile={launch_profile.name}, headless={options['headless']}, user_data_dir={user_data_dir})..."
     )
-    context = browser.new_context()
-    page = context.new_page()
+    
+    with _launch_lock:
+        existing_children: Set[int] = set(child_pids(os.getpid()))
+        playwright = sync_playwright().start()
+        new_children = [pid for pid in child_pids(os.getpid()) if pid not in existing_children]
+    
+    try:
+        if user_data_dir:
+            context = playwright.chromium.launch_persistent_context(
+                user_data_dir,
+                **options,
+                **launch_profile.context_options,
+            )
+            browser = PersistentContextBrowser(context, user_data_dir)
+            page = context.pages[0] if context.pages else context.new_page()
+        else:
+            browser = playwright.chromium.launch(**options)
+            context = browser.new_context(**launch_profile.context_options)
+            page = context.new_page()
+    except Exception:
+        # 起動に失敗した場合も、同じスレッドで再試行できるようドライバーを停止する
+        playwright.stop()
+        raise
+    
     browser.playwright = playwright
+    browser.driver_pid = new_children[0] if len(new_children) == 1 else None
+    browser.launch_options = {
+        "headless": headless,
+        "slow_mo": slow_mo,
+        "profile": launch_profile.name,
+        "user_data_dir": user_data_dir,
+    }
+    browser.context_options = launch_profile.context_options
+    # 新しいコンテキストに適用する関数（ナビゲーションのスケジューラなど）
+    browser.context_hooks = []
     browser.context = context
     browser.page = page
     print("Custom sync Playwright browser created successfully!")
@@ -39,6 +299,38 @@ def create_custom_sync_playwright_browser(
 def get_current_page(browser: Any) -> Any:
     return browser.page
 
+def replace_browser_context(browser: Any, storage_state: Optional[Dict[str, Any]] = None) -> Any:
+    """Replace the browser's context and page with fresh ones.
+    
+    Args:
+        browser: Browser created by create_custom_sync_playwright_browser.
+        storage_state: Optional cookies and local storage to start the new context with.
+        
+    Returns:
+        The new page.
+    """
+    if isinstance(browser, PersistentContextBrowser):
+        # 永続コンテキストは閉じずに初期化し、ディスクキャッシュを残す
+        browser.context = browser.new_context(storage_state=storage_state)
+    else:
+        browser.context.close()
+        browser.context = browser.new_context(
+            storage_state=storage_state,
+            **getattr(browser, "context_options", {})
+        )
+    for hook in getattr(browser, "context_hooks", []):
+        hook(browser.context)
+    browser.page = browser.context.new_page()
+    return browser.page
+
+def reset_browser_context(browser: Any) -> Any:
+    """Replace the browser's context and page with fresh ones, discarding cookies and storage.
+    
+    Returns:
+        The new page.
+    """
+    return replace_browser_context(browser)
+
 def close_sync_browser(browser: Any) -> None:
     browser.close()
     browser.playwright.stop()
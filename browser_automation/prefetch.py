@@ -0,0 +1,269 @@
+"""
+Speculative Prefetching
+
+This module prefetches the most likely next pages while the agent is waiting for the LLM.
+After each tool observation, links on the current page are ranked against the user's
+instruction, and prefetch hints for the top candidates are added to the page. Chromium
+then fetches them in the background into its HTTP cache, so a later navigation to one of
+them is served from the cache. Nothing is routed through Python, so the browser's cache
+stays enabled and the Playwright dispatcher is never blocked.
+"""
+
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urldefrag, urlparse
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+# 現在のページ上のリンクを表示順に取得するスクリプト
+COLLECT_LINKS_SCRIPT = """
+() => Array.from(document.querySelectorAll('a[href]')).map((a, index) => {
+    const rect = a.getBoundingClientRect();
+    return {
+        href: a.href,
+        text: (a.innerText || a.title || '').trim().slice(0, 200),
+        index: index,
+        top: rect.top + window.scrollY,
+        visible: rect.width > 0 && rect.height > 0
+    };
+})
+"""
+
+# ブラウザ自身に先読みさせるため、<link rel="prefetch">を追加するスクリプト
+ADD_PREFETCH_HINTS_SCRIPT = """
+urls => urls.forEach(url => {
+    const link = document.createElement('link');
+    link.rel = 'prefetch';
+    link.as = 'document';
+    link.href = url;
+    document.head.appendChild(link);
+})
+"""
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# GETでも状態を変更しがちなリンク（ログアウト・削除・カート追加など）は先読みしない
+SIDE_EFFECT_PATTERN = re.compile(
+    r"(?<![a-z])(log[\s_-]?(out|off)|sign[\s_-]?(out|off)|delete|remove|destroy|unsubscribe|subscribe"
+    r"|cart|basket|checkout|purchase|buy|order|pay|vote|like|unlike|follow|unfollow|confirm|cancel"
+    r"|reset|revoke|approve|archive|add)(?![a-z])",
+    re.IGNORECASE
+)
+
+def _tokenize(text: str) -> set:
+    return {word for word in WORD_PATTERN.findall(text.lower()) if len(word) > 2}
+
+def has_side_effects(link: Dict[str, Any]) -> bool:
+    """Return whether a link looks like it changes server state when opened, e.g. logout or delete."""
+    return bool(SIDE_EFFECT_PATTERN.search(f"{link.get('text', '')} {link['href']}"))
+
+def rank_links(
+    links: List[Dict[str, Any]],
+    instruction: str,
+    current_url: str,
+    same_origin: bool = True,
+) -> List[Dict[str, Any]]:
+    """Rank candidate links by their position on the page and their match against the instruction.
+
+    Links that look like they have side effects are never returned.
+
+    Args:
+        links: Links collected from the page, in document order.
+        instruction: The user's instruction for the current run.
+        current_url: URL of the page the links were collected from.
+        same_origin: Whether to only return links on the current page's origin.
+
+    Returns:
+        The navigable links sorted from most to least likely, each with a "score" key.
+    """
+    instruction_words = _tokenize(instruction)
+    current = urldefrag(current_url)[0]
+    current_origin = urlparse(current)[:2]
+    seen = set()
+    ranked = []
+
+    for link in links:
+        url = urldefrag(link["href"])[0]
+        if urlparse(url).scheme not in ("http", "https") or url == current or url in seen:
+            continue
+        if not link.get("visible", True):
+            continue
+        if same_origin and urlparse(url)[:2] != current_origin:
+            continue
+        if has_side_effects({**link, "href": url}):
+            continue
+        seen.add(url)
+
+        link_words = _tokenize(f"{link.get('text', '')} {url}")
+        match = len(instruction_words & link_words) / len(instruction_words) if instruction_words else 0.0
+        position = 1.0 / (1.0 + link.get("index", 0) / 10.0)
+        ranked.append({**link, "href": url, "score": 2.0 * match + position})
+
+    ranked.sort(key=lambda link: link["score"], reverse=True)
+    return ranked
+
+class SpeculativePrefetcher:
+    """Ask the browser to prefetch likely next pages into its HTTP cache."""
+
+    def __init__(
+        self,
+        sync_browser: Any,
+        top_k: int = 3,
+        ttl: float = 300.0,
+        same_origin: bool = True,
+    ):
+        """Initialize the prefetcher.
+
+        Args:
+            sync_browser: Synchronous browser whose current page receives the prefetch hints.
+            top_k: Number of candidate links to prefetch after each observation.
+            ttl: Seconds a prefetched page is counted as available. Chromium keeps prefetched
+                documents for about five minutes.
+            same_origin: Whether to only prefetch links on the current page's origin.
+                Cross-origin links are fetched with that site's cookies, so opt in with care.
+        """
+        self.sync_browser = sync_browser
+        self.top_k = top_k
+        self.ttl = ttl
+        self.same_origin = same_origin
+        self.instruction = ""
+        self.hits = 0
+        self.misses = 0
+        self._prefetched: Dict[str, float] = {}
+        self._context: Any = None
+
+    def install(self) -> None:
+        """Start counting navigations to prefetched pages as hits."""
+        if self._context is not None:
+            return
+        self._context = self.sync_browser.contexts[0]
+        for page in self._context.pages:
+            page.on("framenavigated", self._on_frame_navigated)
+        self._context.on("page", self._on_page)
+
+    def close(self) -> None:
+        """Stop counting navigations and forget the prefetched pages."""
+        if self._context is not None:
+            self._context.remove_listener("page", self._on_page)
+            for page in self._context.pages:
+                page.remove_listener("framenavigated", self._on_frame_navigated)
+            self._context = None
+        self._prefetched.clear()
+
+    def observe(self) -> List[str]:
+        """Rank the links on the current page and prefetch the top candidates.
+
+        Returns:
+            The URLs that were prefetched.
+        """
+        context = self.sync_browser.contexts[0]
+        if not context.pages:
+            return []
+        page = context.pages[-1]
+        self._evict_expired()
+
+        try:
+            links = page.evaluate(COLLECT_LINKS_SCRIPT)
+        except Exception as e:
+            print(f"Prefetch skipped: {str(e)}")
+            return []
+
+        urls = []
+        for link in rank_links(links, self.instruction, page.url, same_origin=self.same_origin):
+            if len(urls) >= self.top_k:
+                break
+            if link["href"] not in self._prefetched:
+                urls.append(link["href"])
+        if not urls:
+            return []
+
+        try:
+            page.evaluate(ADD_PREFETCH_HINTS_SCRIPT, urls)
+        except Exception as e:
+            print(f"Prefetch skipped: {str(e)}")
+            return []
+
+        now = time.time()
+        for url in urls:
+            self._prefetched[url] = now
+        return urls
+
+    def metrics(self) -> Dict[str, int]:
+        """Return how many main-frame navigations went to a prefetched page and how many did not."""
+        return {"hits": self.hits, "misses": self.misses, "prefetched": len(self._prefetched)}
+
+    def _on_page(self, page: Any) -> None:
+        page.on("framenavigated", self._on_frame_navigated)
+
+    def _on_frame_navigated(self, frame: Any) -> None:
+        if frame.parent_frame is not None:
+            return
+        url = urldefrag(frame.url)[0]
+        created_at = self._prefetched.pop(url, None)
+        if created_at is not None and time.time() - created_at <= self.ttl:
+            self.hits += 1
+        elif urlparse(url).scheme in ("http", "https"):
+            self.misses += 1
+
+    def _evict_expired(self) -> None:
+        now = time.time()
+        for url in [url for url, created_at in self._prefetched.items() if now - created_at > self.ttl]:
+            del self._prefetched[url]
+
+class PrefetchCallbackHandler(BaseCallbackHandler):
+    """Callback handler that triggers prefetching after each agent observation."""
+
+    def __init__(self, prefetcher: SpeculativePrefetcher):
+        self.prefetcher = prefetcher
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any) -> None:
+        if kwargs.get("parent_run_id") is None and isinstance(inputs, dict) and inputs.get("input"):
+            self.prefetcher.instruction = str(inputs["input"])
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        self.prefetcher.observe()
+
+def create_prefetch_callbacks(
+    sync_browser: Any,
+    top_k: int = 3,
+    same_origin: bool = True,
+) -> Tuple[List[BaseCallbackHandler], SpeculativePrefetcher]:
+    """Create callbacks that prefetch likely next pages for an agent using the given browser.
+
+    Args:
+        sync_browser: Synchronous browser shared by the agent's tools.
+        top_k: Number of candidate links to prefetch after each observation.
+        same_origin: Whether to only prefetch links on the current page's origin.
+
+    Returns:
+        A tuple of the callback handlers, to pass per call with
+        agent.invoke(..., config={"callbacks": ...}), and the prefetcher, which should be
+        closed once the run is over. Handlers given to the agent's constructor do not
+        receive the tool runs.
+    """
+    prefetcher = SpeculativePrefetcher(sync_browser, top_k=top_k, same_origin=same_origin)
+    prefetcher.install()
+    return [PrefetchCallbackHandler(prefetcher)], prefetcher
+
+def test_rank_links():
+    """Test link ranking with a handful of sample links."""
+    links = [
+        {"href": "https://example.com/", "text": "Home", "index": 0},
+        {"href": "https://example.com/about", "text": "About us", "index": 1},
+        {"href": "https://example.com/docs/playwright", "text": "Playwright tutorial", "index": 12},
+        {"href": "mailto:info@example.com", "text": "Contact", "index": 13},
+        {"href": "https://example.com/logout", "text": "Log out", "index": 2},
+        {"href": "https://example.com/cart?add_to_cart=42", "text": "Add to cart", "index": 3},
+        {"href": "https://other.example.org/playwright", "text": "Playwright elsewhere", "index": 4},
+    ]
+    ranked = rank_links(links, "Find the Playwright tutorial", "https://example.com/")
+
+    print("Ranked links:")
+    for link in ranked:
+        print(f"- {link['href']} (score={link['score']:.2f})")
+
+    print("\nPrefetch ranking test completed!")
+
+if __name__ == "__main__":
+    test_rank_links()
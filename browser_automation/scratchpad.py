@@ -0,0 +1,170 @@
+"""
+Scratchpad Compaction
+
+This module keeps the ReAct agent's scratchpad within a token ceiling on long runs.
+Recent observations are kept verbatim, while older ones are replaced with short digests
+that point to the full text, which the agent can read again with the recall_observation tool.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import tiktoken
+from langchain.schema import AgentAction
+from langchain.pydantic_v1 import BaseModel, Field
+from langchain.tools.base import BaseTool, ToolException
+
+class ScratchpadManager:
+    """Compact agent intermediate steps so that the scratchpad stays under a token ceiling.
+
+    An instance is passed to the agent executor as trim_intermediate_steps and is called
+    with the full list of steps before every LLM call.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 6000,
+        keep_recent: int = 2,
+        digest_tokens: int = 200,
+        recall_tokens: int = 1500,
+        model: str = "gpt-3.5-turbo",
+    ):
+        """Initialize the scratchpad manager.
+
+        Args:
+            max_tokens: Token ceiling for the whole scratchpad.
+            keep_recent: Number of most recent observations kept verbatim when possible.
+            digest_tokens: Number of leading tokens kept in the digest of an older observation.
+            recall_tokens: Maximum number of tokens returned by one recall_observation call.
+            model: Model name used to select the tiktoken encoding.
+        """
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.digest_tokens = digest_tokens
+        self.recall_tokens = recall_tokens
+        self.encoding = tiktoken.encoding_for_model(model)
+        self._observations: Dict[int, str] = {}
+
+    def count_tokens(self, text: str) -> int:
+        """Count the tokens in a piece of text."""
+        return len(self.encoding.encode(text))
+
+    def recall(self, step: int, offset: int = 0, limit: Optional[int] = None) -> str:
+        """Return part of the full observation of an earlier step.
+
+        Args:
+            step: Step number of the observation.
+            offset: Token offset to start reading from.
+            limit: Maximum number of tokens to return. Defaults to recall_tokens.
+
+        Raises:
+            KeyError: If no observation is stored for the step.
+        """
+        tokens = self.encoding.encode(self._observations[step])
+        limit = min(limit or self.recall_tokens, self.recall_tokens)
+        offset = max(offset, 0)
+        text = self.encoding.decode(tokens[offset:offset + limit])
+        if offset + limit < len(tokens):
+            text += (
+                f"\n[... {len(tokens) - offset - limit} more tokens. "
+                f"Use recall_observation with step={step} and offset={offset + limit} to continue.]"
+            )
+        return text
+
+    def _truncate(self, step: int, observation: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(observation)
+        if len(tokens) <= max_tokens:
+            return observation
+        head = self.encoding.decode(tokens[:max_tokens])
+        return (
+            f"{head}\n[... {len(tokens) - max_tokens} more tokens omitted. "
+            f"Use recall_observation with step={step} to read the full observation.]"
+        )
+
+    def _digest(self, step: int, observation: str) -> str:
+        return self._truncate(step, observation, self.digest_tokens)
+
+    def _reference(self, step: int, observation: str) -> str:
+        return (
+            f"[Observation of step {step} omitted ({self.count_tokens(observation)} tokens). "
+            f"Use recall_observation with step={step} to read it.]"
+        )
+
+    def __call__(self, intermediate_steps: List[Tuple[AgentAction, str]]) -> List[Tuple[AgentAction, str]]:
+        """Return the intermediate steps with older observations compacted."""
+        self._observations = {step: str(observation) for step, (_, observation) in enumerate(intermediate_steps)}
+
+        count = len(intermediate_steps)
+        observations = [
+            self._observations[step] if step >= count - self.keep_recent
+            else self._digest(step, self._observations[step])
+            for step in range(count)
+        ]
+        sizes = [self.count_tokens(observation) for observation in observations]
+        budget = self.max_tokens - sum(self.count_tokens(action.log) for action, _ in intermediate_steps)
+
+        # 上限を超えている間は古い順に要約し、それでも超える場合は参照のみに置き換える
+        for compact in (self._digest, self._reference):
+            for step in range(count - 1):
+                if sum(sizes) <= budget:
+                    break
+                observations[step] = compact(step, self._observations[step])
+                sizes[step] = self.count_tokens(observations[step])
+
+        # 最新の観測結果も上限を超える場合は、残りの予算に収まるよう切り詰める
+        if count and sum(sizes) > budget:
+            last = count - 1
+            remaining = budget - (sum(sizes) - sizes[last])
+            observations[last] = self._truncate(last, self._observations[last], max(remaining - 50, 0))
+
+        return [(action, observations[step]) for step, (action, _) in enumerate(intermediate_steps)]
+
+class RecallObservationArgs(BaseModel):
+    step: int = Field(..., description="Step number of the observation to read again")
+    offset: int = Field(0, description="Token offset to continue reading a long observation from")
+
+class RecallObservationTool(BaseTool):
+    """Tool to read the full text of an observation that was compacted in the scratchpad."""
+
+    name: str = "recall_observation"
+    description: str = "Read again an earlier observation that was omitted or shortened. Long observations are returned in parts; pass the offset given at the end of a part to read the next one"
+    args_schema: Type[BaseModel] = RecallObservationArgs
+    manager: Any = None
+
+    def __init__(self, manager: ScratchpadManager):
+        """Initialize the tool with the scratchpad manager that stores the observations."""
+        super().__init__()
+        self.manager = manager
+
+    def _run(self, step: int, offset: int = 0) -> str:
+        """Run the tool to read an earlier observation.
+
+        Args:
+            step: Step number of the observation
+            offset: Token offset to start reading from
+
+        Returns:
+            Up to recall_tokens tokens of the observation, with a note on how to read the rest
+        """
+        try:
+            return self.manager.recall(step, offset=offset)
+        except KeyError:
+            raise ToolException(f"No observation is stored for step {step}")
+
+def test_scratchpad():
+    """Test the scratchpad manager with a few large fake observations."""
+    manager = ScratchpadManager(max_tokens=500, keep_recent=1, digest_tokens=50)
+    steps = [
+        (AgentAction(tool="extract_text", tool_input={}, log=f"Extract page {i}"), "lorem ipsum " * 300)
+        for i in range(4)
+    ]
+
+    compacted = manager(steps)
+
+    for step, (_, observation) in enumerate(compacted):
+        print(f"Step {step}: {manager.count_tokens(observation)} tokens")
+    print(f"Recalled step 0: {manager.count_tokens(manager.recall(0, limit=100))} tokens")
+
+    print("\nScratchpad test completed!")
+
+if __name__ == "__main__":
+    test_scratchpad()
@@ -6,21 +6,103 @@ browser operation instructions and submit them for processing by the browser-ope
 """
 
 import os
+import threading
+from typing import Optional
+
 import streamlit as st
 from dotenv import load_dotenv
 
 from langchain_setup import create_playwright_toolkit
 from custom_tools import create_custom_tools
-from agent_setup import create_browser_agent
+from agent_setup import create_browser_agent, create_plan_execute_agent
+from playwright_utils import close_sync_browser, create_custom_sync_playwright_browser
+from browser_launcher import DEFAULT_PROFILE, DEFAULT_USER_DATA_DIR, PROFILES
+from prefetch import create_prefetch_callbacks
+from scratchpad import ScratchpadManager
+from job_client import JobClient
 
 load_dotenv()
 
+# 設定されている場合はジョブサーバー経由で実行する
+JOB_SERVER_URL = os.getenv("JOB_SERVER_URL")
+
 st.set_page_config(
     page_title="Browser Automation Tool",
     page_icon="🌐",
     layout="wide"
 )
 
+@st.cache_resource
+def profile_slots():
+    """Return the persistent profile slots in use by sessions of this server, and their lock."""
+    return set(), threading.Lock()
+
+def acquire_profile_slot() -> Optional[int]:
+    """Reserve a persistent profile subdirectory that no other session is using.
+
+    Chromium locks a profile directory while a browser uses it, so concurrent sessions
+    cannot share BROWSER_USER_DATA_DIR. Slots are reused, so their caches stay warm.
+
+    Returns:
+        The slot number, or None if no persistent profile is configured.
+    """
+    if not DEFAULT_USER_DATA_DIR:
+        return None
+    in_use, lock = profile_slots()
+    with lock:
+        slot = 0
+        while slot in in_use:
+            slot += 1
+        in_use.add(slot)
+    return slot
+
+def release_profile_slot(slot: Optional[int]) -> None:
+    """Release a slot reserved by acquire_profile_slot."""
+    if slot is None:
+        return
+    in_use, lock = profile_slots()
+    with lock:
+        in_use.discard(slot)
+
+def launch_session_browser(browser_profile: str, slot: Optional[int]):
+    """Launch a browser with the session's persistent profile, or without one if it is locked."""
+    if slot is None:
+        return create_custom_sync_playwright_browser(profile=browser_profile, user_data_dir=None)
+    try:
+        return create_custom_sync_playwright_browser(
+            profile=browser_profile,
+            user_data_dir=os.path.join(DEFAULT_USER_DATA_DIR, f"session-{slot}")
+        )
+    except Exception as e:
+        # 別プロセスがプロファイルを使用している場合などは、永続化せずに起動する
+        st.warning(f"Could not open the persistent browser profile; using a temporary one instead. ({str(e)})")
+        return create_custom_sync_playwright_browser(profile=browser_profile, user_data_dir=None)
+
+def run_on_job_server(user_instruction: str, agent_mode: str):
+    """Submit the instruction to the job server and show its result."""
+    client = JobClient(JOB_SERVER_URL)
+    mode = "plan" if agent_mode == "Plan and execute" else "react"
+    
+    with st.spinner("Waiting for the job server..."):
+        try:
+            job_id = client.submit_instruction(user_instruction, mode=mode)
+            job = client.wait(job_id)
+        except Exception as e:
+            st.error(f"An error occurred while talking to the job server: {str(e)}")
+            return
+    
+    if job["status"] == "failed":
+        st.error(f"An error occurred during automation: {job['error']}")
+        return
+    
+    st.success(f"Automation completed successfully! (job {job_id})")
+    st.subheader("Result")
+    st.write(job["result"]["output"])
+    
+    if "flow" in job["result"]:
+        with st.expander(f"Executed flow ({job['result']['llm_calls']} LLM calls)"):
+            st.json(job["result"]["flow"])
+
 def main():
     """Main function to run the Streamlit app."""
     
@@ -57,8 +139,31 @@ def main():
     )
     
     with st.expander("Advanced Options"):
+        agent_mode = st.radio(
+            "Agent mode",
+            ["Step by step (ReAct)", "Plan and execute"],
+            help="Plan and execute asks the model once for a whole flow and runs it without further LLM calls."
+        )
+        browser_profile = st.selectbox(
+            "Browser profile",
+            list(PROFILES),
+            index=list(PROFILES).index(DEFAULT_PROFILE),
+            format_func=lambda name: f"{name} - {PROFILES[name].description}"
+        )
         verbose = st.checkbox("Show detailed agent steps", value=True)
         max_iterations = st.slider("Maximum iterations", min_value=1, max_value=20, value=10)
+        speculative = st.checkbox(
+            "Prefetch likely next pages while the agent is thinking",
+            value=False
+        )
+        compact_scratchpad = st.checkbox("Compact older observations on long runs", value=True)
+        scratchpad_tokens = st.number_input(
+            "Scratchpad token ceiling",
+            min_value=1000,
+            max_value=12000,
+            value=6000,
+            step=500
+        )
     
     if st.button("Run Automation", type="primary"):
         if not user_instruction:
@@ -69,22 +174,51 @@ def main():
             st.error("Please provide a valid OpenAI API key.")
             return
         
+        if JOB_SERVER_URL:
+            run_on_job_server(user_instruction, agent_mode)
+            return
+        
         with st.spinner("Running browser automation..."):
+            browser = None
+            prefetcher = None
+            profile_slot = acquire_profile_slot()
             try:
-                standard_tools = create_playwright_toolkit()
-                custom_tools = create_custom_tools()
-                all_tools = standard_tools + custom_tools
+                browser = launch_session_browser(browser_profile, profile_slot)
                 
-                agent = create_browser_agent(all_tools, verbose=verbose)
-                
-                result = agent.invoke({
-                    "input": user_instruction
-                })
+                if agent_mode == "Plan and execute":
+                    agent = create_plan_execute_agent(sync_browser=browser, verbose=verbose)
+                    result = agent.invoke({
+                        "input": user_instruction
+                    })
+                else:
+                    standard_tools = create_playwright_toolkit(sync_browser=browser)
+                    custom_tools = create_custom_tools(sync_browser=browser)
+                    all_tools = standard_tools + custom_tools
+                    
+                    scratchpad = ScratchpadManager(max_tokens=int(scratchpad_tokens)) if compact_scratchpad else None
+                    agent = create_browser_agent(
+                        all_tools,
+                        verbose=verbose,
+                        scratchpad=scratchpad
+                    )
+                    
+                    # ツール実行にも伝わるよう、コールバックは実行時に渡す
+                    callbacks = []
+                    if speculative:
+                        callbacks, prefetcher = create_prefetch_callbacks(browser)
+                    result = agent.invoke(
+                        {"input": user_instruction},
+                        config={"callbacks": callbacks}
+                    )
                 
                 st.success("Automation completed successfully!")
                 st.subheader("Result")
                 st.write(result["output"])
                 
+                if "flow" in result:
+                    with st.expander(f"Executed flow ({result['llm_calls']} LLM calls)"):
+                        st.json(result["flow"])
+                
                 screenshot_files = [f for f in os.listdir() if f.endswith('.png') and f.startswith('screenshot')]
                 if screenshot_files:
                     st.subheader("Screenshots")
@@ -93,6 +227,12 @@ def main():
                 
             except Exception as e:
                 st.error(f"An error occurred during automation: {str(e)}")
+            finally:
+                if prefetcher is not None:
+                    prefetcher.close()
+                if browser is not None:
+                    close_sync_browser(browser)
+                release_profile_slot(profile_slot)
     
     st.markdown("---")
     st.markdown(